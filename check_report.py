@@ -0,0 +1,605 @@
+#!/usr/bin/env python3
+"""
+generate_summary_md.py の回帰チェック — ゴールデン出力の一致 + タイトル取得 + スループット判定
+
+合成コーパス（乱数シード固定）からレポートを作り、golden/ に保存した出力と比べる。
+MD はバイト単位、xlsx はシート・セル単位（値と表示形式）で一致を見る。
+タイトル取得（--fetch-titles）は localhost のスタブサーバー相手に動かして挙動を確かめる。
+あわせてベンチ用コーパスで generate_md / generate_xlsx の処理速度（件/秒）を測り、
+同じプロセスで測った基準処理との速度比が基準値から閾値を超えて落ちていれば失敗にする
+（速度比なのでマシンの速さに依存しない）。
+
+Usage:
+  python3 check_report.py                      # 比較 + スループット判定
+  python3 check_report.py --update             # 今の出力でゴールデンと基準値を更新
+  python3 check_report.py --skip-bench         # 出力の比較とタイトル取得だけ
+  python3 check_report.py --bench-only --max-regression 0.2
+"""
+
+import json, sys, argparse, io, random, re, tempfile, time, threading
+from collections import Counter
+from contextlib import redirect_stderr
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+import generate_summary_md as gsm
+
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+THROUGHPUT_FILE = "throughput.json"
+FIXED_NOW = "2026-01-01 00:00"
+FLOAT_DIGITS = 9  # xlsx の浮動小数は丸めて比べる（PageRank 等の末尾の揺れを無視）
+
+# ============================================================
+# 合成コーパス
+# ============================================================
+
+WORDS = [
+    "Claude Codeで副業", "SEO対策のコツ", "LP制作 figma", "新機能リリース速報", "AIで稼ぐ方法まとめ",
+    "今日のランチ", "起業して売上1億", "フォロワーが伸びるポスト", "広告運用のCVR改善", "thread 🧵 how to use gpt",
+    "失敗した話", "これどう思う？", "プロンプトの書き方", "ブログ記事の執筆", "作り置きレシピ", "寝かしつけのコツ",
+]
+NOISE_TEXTS = ["como estamos também", "안녕하세요 여러분", "porque entonces nosotros"]
+LINKS = [
+    "https://example.com/a?utm_source=x", "http://www.example.com/a/", "https://note.com/foo/n/abc",
+    "https://www.youtube.com/watch?v=1&si=zz", "https://zenn.dev/x/articles/y",
+]
+
+
+def make_corpus(n, seed, id_offset=0, users=None):
+    """ツイート n 件の合成コーパス。X記事・外部リンク・メディア・引用・スレッド・ノイズを含む"""
+    rng = random.Random(seed)
+    users = users or [f"user{i}" for i in range(max(5, n // 8))]
+    tweets = []
+    for i in range(n):
+        u = rng.choice(users)
+        tid = str(10**18 + id_offset + i)
+        conv = str(10**18 + id_offset + rng.randrange(i)) if i and rng.random() < 0.3 else tid
+        text = " ".join(rng.sample(WORDS, rng.randint(1, 3)))
+        urls, meta, pt, media = [], [], "text", []
+        r = rng.random()
+        if r < 0.1:
+            text = f"https://t.co/a{i}"
+            urls = [f"https://x.com/i/article/{id_offset + i}"]
+        elif r < 0.3:
+            link = rng.choice(LINKS)
+            urls = [link]
+            meta = [{"url": "https://t.co/z", "expanded_url": link, "title": rng.choice(["", "Example Title"])}]
+            pt = "article_link"
+        elif r < 0.4:
+            media = [{"key": "m", "type": "photo"}]
+            pt = "media"
+        elif r < 0.43:
+            text = rng.choice(NOISE_TEXTS)
+        refs = []
+        if i and rng.random() < 0.2:
+            refs = [{"type": "quoted", "id": str(10**18 + id_offset + rng.randrange(i))}]
+            pt = "quote" if pt == "text" else pt
+        likes = int(rng.paretovariate(1.2) * 5)
+        tweets.append({
+            "id": tid, "text": text, "author_id": u, "username": u, "name": u,
+            "author_followers": rng.choice([0, 10, 500, 3000, 50000, 2000000]),
+            "created_at": f"2026-10-{1 + i % 28:02d}T{i % 24:02d}:00:00.000Z", "conversation_id": conv,
+            "metrics": {
+                "likes": likes, "retweets": likes // 3, "replies": 1, "quotes": 0,
+                "impressions": likes * 40, "bookmarks": int(likes * rng.random() * 1.2),
+            },
+            "urls": urls, "url_meta": meta, "media": media,
+            "mentions": rng.sample(users, rng.randint(0, 2)), "hashtags": [],
+            "tweet_url": f"https://x.com/{u}/status/{tid}", "account_url": f"https://x.com/{u}",
+            "referenced_tweets": refs, "post_type": pt,
+        })
+    return tweets
+
+
+def bump_metrics(tweets, seed):
+    """比較用: 同じ投稿のいいね等を増やしたコピー（前回分 → 今回分）"""
+    rng = random.Random(seed)
+    out = []
+    for t in tweets:
+        t = json.loads(json.dumps(t))
+        for k in ("likes", "bookmarks", "impressions"):
+            t["metrics"][k] = int(t["metrics"][k] * (1 + rng.random()))
+        out.append(t)
+    return out
+
+
+# ============================================================
+# シナリオ
+# ============================================================
+#
+# 各シナリオは JSON を一時ファイルに書き、CLI と同じ load_and_dedupe から通す。
+# 戻り値は (md 文字列, xlsx パス)。
+
+def _write_files(tmp, corpora):
+    paths = []
+    for name, tweets in corpora:
+        path = Path(tmp) / f"{name}.json"
+        path.write_text(json.dumps(tweets, ensure_ascii=False), encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def _titles(tweets):
+    """X記事の半分にタイトルを付けるマッピング"""
+    return {t["id"]: f"記事タイトル{t['id'][-3:]}の稼ぐ方法" for t in tweets
+            if t["text"].startswith("https://t.co/") and int(t["id"]) % 2 == 0}
+
+
+def _render(data, tmp, slug, xlsx_writer):
+    data.now = FIXED_NOW
+    md = io.StringIO()
+    gsm.write_md(data, out=md)
+    xlsx_path = Path(tmp) / f"{slug}.xlsx"
+    xlsx_writer(xlsx_path)
+    return md.getvalue(), xlsx_path
+
+
+def scenario_basic(tmp):
+    """3ラベル・タイトル付き・--cross・--discover"""
+    corpora = [("A", make_corpus(200, 1)), ("B", make_corpus(120, 2, 100_000)), ("C", make_corpus(80, 3, 200_000))]
+    files = _write_files(tmp, corpora)
+    title_map = {}
+    for _, tweets in corpora:
+        title_map.update(_titles(tweets))
+    labels = ["A", "B", "C"]
+    all_tweets, per_label = gsm.load_and_dedupe(files, labels, title_map)
+    cross = [("topic", "label"), ("tag", "followers")]
+    data = gsm.ReportData("回帰 basic", all_tweets, per_label, labels, queries=["qa", "qb", "qc"],
+                          cross_specs=cross, discover_k=6)
+    return _render(data, tmp, "basic", lambda p: gsm.generate_xlsx(p, all_tweets, per_label, data=data))
+
+
+def scenario_diff(tmp):
+    """--baseline 相当（前回分と今回分の突き合わせ。前回分はコーパスから）"""
+    base = make_corpus(250, 4)
+    cur = bump_metrics(base[:150], 5) + make_corpus(120, 6, 500_000)
+    base_files = _write_files(tmp, [("base", base)])
+    cur_files = _write_files(tmp, [("cur", cur)])
+    # 前回分は保存済みコーパスだけから読む（--baseline-corpus 単独と同じ経路。元の JSON は使わない）
+    base_corpus = Path(tmp) / "base.corpus"
+    gsm.write_corpus(base_corpus, list(gsm.iter_source_tweets(base_files)), base_files)
+    base_labels = [Path(f).stem for f in gsm.corpus_source_files(base_corpus)]
+    base_tweets, base_per_label = gsm.load_and_dedupe([], base_labels, corpus_path=base_corpus)
+    all_tweets, per_label = gsm.load_and_dedupe(cur_files, ["cur"])
+    baseline = gsm.ReportData("先週", base_tweets, base_per_label)
+    data = gsm.ReportData("回帰 diff", all_tweets, per_label, ["cur"], baseline=baseline)
+    return _render(data, tmp, "diff", lambda p: gsm.generate_xlsx(p, all_tweets, per_label, data=data))
+
+
+def scenario_stream(tmp):
+    """--stream（固定長ヒープとスケッチ）"""
+    files = _write_files(tmp, [("A", make_corpus(300, 7)), ("B", make_corpus(300, 8, 100_000))])
+    data = gsm.StreamReportData("回帰 stream", ["A", "B"], account_capacity=20)
+    for _, t in gsm.iter_loaded_tweets(files, ["A", "B"]):
+        data.add(t)
+    return _render(data, tmp, "stream", lambda p: gsm.generate_stream_xlsx(p, data))
+
+
+SCENARIOS = {
+    "basic": scenario_basic,
+    "diff": scenario_diff,
+    "stream": scenario_stream,
+}
+
+# ============================================================
+# 比較
+# ============================================================
+
+def _cell(value):
+    if isinstance(value, float):
+        return round(value, FLOAT_DIGITS)
+    if value is not None and not isinstance(value, (int, str, bool)):
+        return str(value)
+    return value
+
+
+def dump_xlsx(path):
+    """{シート名: [[(値, 表示形式), ...], ...]}（シート順を保つ）"""
+    wb = load_workbook(path)
+    return {
+        ws.title: [[[_cell(c.value), c.number_format] for c in row] for row in ws.iter_rows()]
+        for ws in wb.worksheets
+    }
+
+
+def format_cells(cells):
+    """dump_xlsx の結果を1行1セル行の JSON にする（git の差分で読めるように）"""
+    parts = []
+    for sheet, rows in cells.items():
+        body = ",\n".join(json.dumps(row, ensure_ascii=False) for row in rows)
+        parts.append(f"{json.dumps(sheet, ensure_ascii=False)}: [\n{body}\n]")
+    return "{\n" + ",\n".join(parts) + "\n}\n"
+
+
+def diff_md(expected, actual):
+    """最初に食い違う行の説明。一致なら None"""
+    if expected == actual:
+        return None
+    exp_lines, act_lines = expected.split("\n"), actual.split("\n")
+    for i, (e, a) in enumerate(zip(exp_lines, act_lines), 1):
+        if e != a:
+            return f"{i}行目\n    期待: {e!r}\n    実際: {a!r}"
+    return f"行数が違う（期待 {len(exp_lines)} / 実際 {len(act_lines)}）"
+
+
+def diff_xlsx(expected, actual):
+    """食い違うセルの説明リスト（最大10件）"""
+    problems = []
+    if list(expected) != list(actual):
+        problems.append(f"シート構成: 期待 {list(expected)} / 実際 {list(actual)}")
+    for sheet in expected:
+        if sheet not in actual:
+            continue
+        exp_rows, act_rows = expected[sheet], actual[sheet]
+        if len(exp_rows) != len(act_rows):
+            problems.append(f"[{sheet}] 行数: 期待 {len(exp_rows)} / 実際 {len(act_rows)}")
+        for r, (er, ar) in enumerate(zip(exp_rows, act_rows), 1):
+            for c, (ec, ac) in enumerate(zip(er, ar), 1):
+                if ec != ac:
+                    coord = f"{get_column_letter(c)}{r}"
+                    problems.append(f"[{sheet}] {coord}: 期待 {ec!r} / 実際 {ac!r}")
+            if len(er) != len(ar):
+                problems.append(f"[{sheet}] {r}行目の列数: 期待 {len(er)} / 実際 {len(ar)}")
+            if len(problems) >= 10:
+                return problems
+    return problems
+
+
+def check_golden(names, update=False):
+    """各シナリオの出力をゴールデンと比べる（update=True なら書き換える）。失敗数を返す"""
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            with redirect_stderr(io.StringIO()):  # ノイズ除去のログは出さない
+                md, xlsx_path = SCENARIOS[name](tmp)
+            cells = dump_xlsx(xlsx_path)
+            md_golden = GOLDEN_DIR / f"{name}.md"
+            xlsx_golden = GOLDEN_DIR / f"{name}.xlsx.json"
+            if update:
+                GOLDEN_DIR.mkdir(exist_ok=True)
+                md_golden.write_text(md, encoding="utf-8")
+                xlsx_golden.write_text(format_cells(cells), encoding="utf-8")
+                print(f"[更新] {name}: {md_golden.name}, {xlsx_golden.name}")
+                continue
+            if not md_golden.exists() or not xlsx_golden.exists():
+                print(f"[NG] {name}: ゴールデンがありません（--update で作成）")
+                failures += 1
+                continue
+            problems = []
+            md_problem = diff_md(md_golden.read_text(encoding="utf-8"), md)
+            if md_problem:
+                problems.append(f"MD: {md_problem}")
+            problems.extend(f"xlsx: {p}" for p in diff_xlsx(
+                json.loads(xlsx_golden.read_text(encoding="utf-8")), cells))
+            if problems:
+                failures += 1
+                print(f"[NG] {name}")
+                for p in problems:
+                    print(f"  {p}")
+            else:
+                print(f"[OK] {name}")
+    return failures
+
+# ============================================================
+# バイナリコーパスの往復
+# ============================================================
+
+def _odd_tweets():
+    """コーパスのカラムに収まらない値を持つツイート"""
+    base = make_corpus(3, 21, 900_000)
+    base[0]["metrics"]["views"] = 123              # 固定6キー以外の metrics
+    base[1]["metrics"] = {"likes": 5, "bookmarks": 1.5}  # キー不足・int 以外
+    base[1]["author_followers"] = None
+    base[2]["_title"] = ""                          # 空文字のフィールド
+    base[2]["conversation_id"] = 42                 # str 以外
+    base[2]["created_at"] = None
+    del base[2]["tweet_url"]
+    return base
+
+
+def check_corpus():
+    """JSON から読んだツイートと、コーパス経由のツイートが同じ dict になるか。失敗数を返す"""
+    with tempfile.TemporaryDirectory() as tmp:
+        files = _write_files(tmp, [("A", make_corpus(200, 20)), ("odd", _odd_tweets())])
+        records = list(gsm.iter_source_tweets(files))
+        corpus_path = Path(tmp) / "x.corpus"
+        gsm.write_corpus(corpus_path, records, files)
+        corpus = gsm.Corpus(corpus_path)
+        try:
+            mismatched = [t["id"] for (_, t), (_, ct) in zip(records, gsm._iter_corpus_tweets(corpus))
+                          if dict(ct) != t]
+            ok = len(corpus) == len(records) and not mismatched
+        finally:
+            corpus.close()
+    print(f"[{'OK' if ok else 'NG'}] コーパス往復: {len(records)}件" + (f"（不一致 {mismatched[:5]}）" if not ok else ""))
+    return int(not ok)
+
+# ============================================================
+# 壊れた URL
+# ============================================================
+
+BAD_URLS = ["https://example.com:99999/x", "http://[::1", "http://[::1]:70000/"]
+
+
+def check_bad_urls():
+    """urlsplit が ValueError を出す URL を含む入力でもレポートが最後まで出るか。失敗数を返す"""
+    tweets = make_corpus(40, 22, 950_000)
+    for i, t in enumerate(tweets):
+        url = BAD_URLS[i % len(BAD_URLS)]
+        t["url_meta"] = [{"url": "https://t.co/z", "expanded_url": url, "title": ""}]
+        t["urls"] = [url]
+        t["tweet_url"] = url
+    problem = None
+    with tempfile.TemporaryDirectory() as tmp:
+        files = _write_files(tmp, [("bad", tweets)])
+        try:
+            with redirect_stderr(io.StringIO()):
+                all_tweets, per_label = gsm.load_and_dedupe(files, ["bad"])
+                data = gsm.ReportData("壊れたURL", all_tweets, per_label, ["bad"])
+                _render(data, tmp, "bad", lambda p: gsm.generate_xlsx(p, all_tweets, per_label, data=data))
+                stream = gsm.StreamReportData("壊れたURL", ["bad"])
+                for _, t in gsm.iter_loaded_tweets(files, ["bad"]):
+                    stream.add(t)
+                _render(stream, tmp, "bad_stream", lambda p: gsm.generate_stream_xlsx(p, stream))
+            fetcher = gsm.TitleFetcher(None, offline=True)
+            fetcher.enrich(all_tweets)
+            fetcher.close()
+            if len(data.links) != len(BAD_URLS):
+                problem = f"リンク {len(data.links)}件（期待 {len(BAD_URLS)}件）"
+        except ValueError as e:
+            problem = f"{type(e).__name__}: {e}"
+    print(f"[{'NG' if problem else 'OK'}] 壊れたURL: {', '.join(BAD_URLS)}" + (f"（{problem}）" if problem else ""))
+    return int(problem is not None)
+
+# ============================================================
+# タイトル取得（スタブサーバー）
+# ============================================================
+#
+# http.server を 127.0.0.1 の空きポートで立て、TitleFetcher を実際のソケット越しに動かす。
+# 接続の使い回し・同一ホストの同時接続数・リダイレクト・chunked・タイムアウト・
+# 不正な応答・本文なし（204）・順番待ちがタイムアウトに数えられないことを見る。
+
+STUB_TIMEOUT = 0.5
+STUB_PER_HOST = 2
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """/page/<名前> → og:title「記事 <名前>」、ほかは各ケース用の応答"""
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.stats["conns"] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        stats, lock = self.server.stats, self.server.lock
+        with lock:
+            stats["requests"] += 1
+        path = self.path
+        if path.startswith("/page/"):
+            with lock:
+                stats["active"] += 1
+                stats["max_active"] = max(stats["max_active"], stats["active"])
+            try:
+                time.sleep(0.02)  # 同時接続数を観測できるよう少し待つ
+                name = path.rsplit("/", 1)[-1]
+                self._send(200, f'<html><head><meta property="og:title" content="記事 {name}">'
+                                f'<title>fallback</title></head></html>'.encode("utf-8"))
+            finally:
+                with lock:
+                    stats["active"] -= 1
+        elif path.startswith("/paced/"):
+            time.sleep(STUB_TIMEOUT * 0.6)  # 1件はタイムアウト内、同一ホストで並ぶと合計は超える
+            self._send(200, f"<title>順番 {path.rsplit('/', 1)[-1]}</title>".encode("utf-8"))
+        elif path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/page/redirected")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif path == "/chunked":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for part in (b"<html><head>", "<title>チャンク &amp; 本文</title>".encode("utf-8"), b"</head></html>"):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+            self.wfile.write(b"0\r\n\r\n")
+        elif path == "/slow":
+            time.sleep(STUB_TIMEOUT * 4)
+            self._send(200, b"<title>late</title>")
+        elif path == "/malformed":
+            self.wfile.write(b"garbage\r\n\r\n")
+            self.close_connection = True
+        elif path == "/nocontent":
+            self.send_response(204)  # Content-Length なし・keep-alive
+            self.end_headers()
+        else:
+            self._send(404, b"not found")
+
+    def _send(self, code, body):
+        self.send_response(code)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.lock = threading.Lock()
+        self.stats = {"conns": 0, "requests": 0, "active": 0, "max_active": 0}
+
+    def handle_error(self, request, client_address):
+        pass  # タイムアウトで切られた後の書き込みエラーは想定どおり
+
+
+def check_fetch():
+    """スタブサーバー相手に TitleFetcher を動かす。失敗数を返す"""
+    server = _StubServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    pages = [f"{base}/page/{i}" for i in range(12)]
+    odd = {f"{base}/{name}": name for name in ("redirect", "chunked", "slow", "malformed", "nocontent")}
+    paced = [f"{base}/paced/{i}" for i in range(STUB_PER_HOST * 4)]
+    tmp = tempfile.TemporaryDirectory()
+    store = gsm.TitleStore(Path(tmp.name) / "titles.db")
+    fetcher = gsm.TitleFetcher(store, concurrency=8, per_host=STUB_PER_HOST, timeout=STUB_TIMEOUT)
+    try:
+        with redirect_stderr(io.StringIO()):
+            titles = fetcher.fetch_many(pages + list(odd))
+            start = time.perf_counter()
+            nocontent = fetcher.fetch_many([f"{base}/nocontent"])
+            nocontent_elapsed = time.perf_counter() - start
+            paced_titles = fetcher.fetch_many(paced)
+        cached = store.lookup_urls([gsm.normalize_url(url) for url in odd], gsm.FETCH_RETRY_AFTER)
+    finally:
+        fetcher.close()
+        store.close()
+        tmp.cleanup()
+        server.shutdown()
+        server.server_close()
+    by_name = {name: titles[url] for url, name in odd.items()}
+    stats = server.stats
+    checks = [
+        ("ページのタイトル（失敗した URL があっても他は取れる）",
+         all(titles[url] == f"記事 {url.rsplit('/', 1)[-1]}" for url in pages), ""),
+        ("接続の使い回し", stats["conns"] < stats["requests"], f"接続 {stats['conns']} / リクエスト {stats['requests']}"),
+        ("同一ホストの同時接続数", stats["max_active"] <= STUB_PER_HOST,
+         f"最大 {stats['max_active']} / 上限 {STUB_PER_HOST}"),
+        ("リダイレクト", by_name["redirect"] == "記事 redirected", repr(by_name["redirect"])),
+        ("chunked", by_name["chunked"] == "チャンク & 本文", repr(by_name["chunked"])),
+        ("タイムアウトは空タイトル", by_name["slow"] == "", repr(by_name["slow"])),
+        ("タイムアウトはストアに記録しない", gsm.normalize_url(f"{base}/slow") not in cached,
+         "記録あり" if gsm.normalize_url(f"{base}/slow") in cached else ""),
+        ("順番待ちはタイムアウトに数えない",
+         all(paced_titles[url] == f"順番 {url.rsplit('/', 1)[-1]}" for url in paced),
+         f"取得 {sum(1 for url in paced if paced_titles[url])}/{len(paced)}"),
+        ("不正なステータス行は空タイトル", by_name["malformed"] == "", repr(by_name["malformed"])),
+        ("204 は本文を待たない", nocontent[f"{base}/nocontent"] == "" and nocontent_elapsed < STUB_TIMEOUT,
+         f"{nocontent_elapsed:.2f}秒"),
+    ]
+    failures = 0
+    for label, ok, detail in checks:
+        failures += not ok
+        print(f"[{'OK' if ok else 'NG'}] タイトル取得: {label}" + (f"（{detail}）" if detail else ""))
+    return failures
+
+# ============================================================
+# スループット
+# ============================================================
+
+BENCH_TWEETS = 10000
+BENCH_REPEAT = 3
+REFERENCE_PASSES = 10  # 基準処理の繰り返し回数（短すぎると計測の揺れが効くので 0.1 秒程度にする）
+_REF_WORD_RE = re.compile(r"\w+")
+
+
+def _best_rate(n, fn, repeat=BENCH_REPEAT):
+    """repeat 回のうち最速の 件/秒"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return n / best
+
+
+def reference_workload(all_tweets):
+    """マシンの速さの物差しにする素朴な Python 処理（本文の正規表現・dict 集計・ソート・JSON 化）。
+    generate_summary_md.py の変更では速さが変わらないので、これとの速度比で回帰を見る"""
+    for _ in range(REFERENCE_PASSES):
+        counts = Counter()
+        for t in all_tweets:
+            lk = t["metrics"]["likes"]
+            for w in _REF_WORD_RE.findall(t.get("text", "")):
+                counts[w] += lk
+        ranked = sorted(all_tweets, key=lambda t: (-t["metrics"]["likes"], t["id"]))
+        json.dumps([{"id": t["id"], "text": t["text"]} for t in ranked[:1000]], ensure_ascii=False)
+    return counts.most_common(10)
+
+
+def measure_throughput(n=BENCH_TWEETS):
+    """{"reference": 件/秒, "generate_md": 件/秒, "generate_xlsx": 件/秒}"""
+    with tempfile.TemporaryDirectory() as tmp:
+        files = _write_files(tmp, [("A", make_corpus(n // 2, 11)), ("B", make_corpus(n - n // 2, 12, 10_000_000))])
+        with redirect_stderr(io.StringIO()):
+            all_tweets, per_label = gsm.load_and_dedupe(files, ["A", "B"])
+        total = len(all_tweets)
+        xlsx_path = Path(tmp) / "bench.xlsx"
+        return {
+            "reference": _best_rate(total, lambda: reference_workload(all_tweets)),
+            "generate_md": _best_rate(total, lambda: gsm.generate_md("bench", all_tweets, per_label, ["A", "B"])),
+            "generate_xlsx": _best_rate(total, lambda: gsm.generate_xlsx(xlsx_path, all_tweets, per_label)),
+            "reference_after": _best_rate(total, lambda: reference_workload(all_tweets)),
+        }
+
+
+def check_throughput(max_regression, update=False):
+    """基準処理との速度比が基準値より max_regression（割合）を超えて落ちていれば失敗。失敗数を返す。
+    基準処理は前後2回測って速い方を使う（途中でマシンが混んだぶんを片寄らせない）"""
+    rates = measure_throughput()
+    reference = max(rates.pop("reference"), rates.pop("reference_after"))
+    ratios = {key: rate / reference for key, rate in rates.items()}
+    path = GOLDEN_DIR / THROUGHPUT_FILE
+    if update:
+        GOLDEN_DIR.mkdir(exist_ok=True)
+        path.write_text(json.dumps({"tweets": BENCH_TWEETS, **{k: round(v, 4) for k, v in ratios.items()}},
+                                   indent=2) + "\n", encoding="utf-8")
+        for key, ratio in ratios.items():
+            print(f"[更新] {key}: 基準処理の {ratio:.4f} 倍（{rates[key]:,.0f}件/秒）")
+        return 0
+    if not path.exists():
+        print(f"[NG] スループット基準値がありません（--update で作成）")
+        return 1
+    baseline = json.loads(path.read_text(encoding="utf-8"))
+    failures = 0
+    for key, ratio in ratios.items():
+        floor = baseline[key] * (1 - max_regression)
+        ok = ratio >= floor
+        failures += not ok
+        print(f"[{'OK' if ok else 'NG'}] {key}: 基準処理の {ratio:.4f} 倍（基準 {baseline[key]:.4f}、"
+              f"下限 {floor:.4f}）{rates[key]:,.0f}件/秒")
+    return failures
+
+# ============================================================
+# main
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="generate_summary_md.py の回帰チェック（ゴールデン出力 + スループット）")
+    parser.add_argument("--update", action="store_true", help="今の出力でゴールデンとスループット基準値を書き換える")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS), help="比べるシナリオ")
+    parser.add_argument("--skip-bench", action="store_true", help="スループット判定をしない")
+    parser.add_argument("--bench-only", action="store_true", help="スループット判定だけ行う")
+    parser.add_argument("--skip-fetch", action="store_true", help="タイトル取得（スタブサーバー）のチェックをしない")
+    parser.add_argument("--max-regression", type=float, default=0.3,
+                        help="基準値から許す速度低下の割合（default: 0.3 = 30%%まで）")
+    args = parser.parse_args()
+
+    failures = 0
+    if not args.bench_only:
+        failures += check_golden(args.scenarios, update=args.update)
+        failures += check_corpus()
+        failures += check_bad_urls()
+        if not args.skip_fetch:
+            failures += check_fetch()
+    if not args.skip_bench:
+        failures += check_throughput(args.max_regression, update=args.update)
+    if failures:
+        print(f"{failures}件の不一致/速度低下", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,17 @@ Usage:
     --titles /tmp/titles.json
 """
 
-import json, sys, argparse, re
+import json, sys, argparse, re, os, io, mmap, math, time, random, struct, sqlite3, heapq, hashlib, zipfile
+import asyncio, ssl, html, inspect
+from array import array
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from collections import Counter, defaultdict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from functools import cached_property, wraps
+from itertools import groupby, islice
+from urllib.parse import urlsplit, urlunsplit, urljoin, parse_qsl, urlencode
 
 try:
     from openpyxl import Workbook
@@ -51,32 +58,20 @@ TOPIC_RULES = [
     ("速報/ニュース", ["速報", "新機能", "リリース", "公開", "breaking", "ベータ", "発表", "コアアプデ"]),
 ]
 
-def detect_topics(t):
-    """テキストから話題を検出"""
+def topic_text(t):
+    """話題判定に使う小文字化テキスト。t.co リンクだけの投稿はタイトル（なければ空）"""
     text = t.get("text", "").lower()
     if re.match(r'^https?://t\.co/\S+$', text.strip()):
         # X記事等でテキストなし → タイトルがあれば使う
-        title = t.get("_title", "")
-        if title:
-            text = title.lower()
-        else:
-            return []
-    # 短いキーワード（4文字以下の英字のみ）はワードバウンダリで検索
-    SHORT_EN_RE = re.compile(r'^[a-z]{1,4}$')
-    topics = []
-    for topic, keywords in TOPIC_RULES:
-        matched = False
-        for kw in keywords:
-            if SHORT_EN_RE.match(kw):
-                if re.search(r'\b' + re.escape(kw) + r'\b', text):
-                    matched = True
-                    break
-            elif kw in text:
-                matched = True
-                break
-        if matched:
-            topics.append(topic)
-    return topics
+        return t.get("_title", "").lower()
+    return text
+
+def detect_topics(t):
+    """テキストから話題を検出"""
+    text = topic_text(t)
+    if not text:
+        return []
+    return get_rules().match_topics(text)
 
 # ============================================================
 # X記事検出 & post_type修正
@@ -128,6 +123,20 @@ def get_display_text(t, max_len=0):
         return text[:max_len] + "…"
     return text
 
+# バズ要因タグ（キーワード部分一致）。本文用とタイトル用
+BUZZ_TEXT_RULES = [
+    ("ハウツー/まとめ", ["how to", "方法", "guide", "tips", "tutorial", "step", "コツ", "やり方", "入門", "まとめ"]),
+    ("収益系", ["$", "revenue", "earn", "稼", "profit", "made $", "income", "money", "年収", "売上"]),
+    ("体験談/リアル", ["scared", "失敗", "lost", "怖", "mistake", "wrong", "regret", "倒産", "地獄"]),
+    ("速報/リリース", ["just", "今", "breaking", "公開", "shipped", "released", "announcing", "速報"]),
+    ("スレッド", ["thread", "🧵", "ツリー"]),
+]
+BUZZ_TITLE_RULES = [
+    ("ハウツー/まとめ", ["方法", "まとめ", "入門", "コツ", "やり方"]),
+    ("収益系", ["年収", "稼", "売上", "金持ち"]),
+    ("体験談/リアル", ["失敗", "倒産", "地獄"]),
+]
+
 def tag_buzz_reason(t):
     tags = []
     text = t["text"].lower()
@@ -140,20 +149,15 @@ def tag_buzz_reason(t):
     elif t.get("media") and len(t.get("media", [])) > 0: tags.append("ビジュアル")
     if not is_url_only and len(raw_text) < 80: tags.append("短文一撃")
 
+    rules = get_rules()
     if not is_url_only:
-        if any(w in text for w in ["how to", "方法", "guide", "tips", "tutorial", "step", "コツ", "やり方", "入門", "まとめ"]): tags.append("ハウツー/まとめ")
-        if any(w in text for w in ["$", "revenue", "earn", "稼", "profit", "made $", "income", "money", "年収", "売上"]): tags.append("収益系")
-        if any(w in text for w in ["scared", "失敗", "lost", "怖", "mistake", "wrong", "regret", "倒産", "地獄"]): tags.append("体験談/リアル")
-        if any(w in text for w in ["just", "今", "breaking", "公開", "shipped", "released", "announcing", "速報"]): tags.append("速報/リリース")
-        if any(w in text for w in ["thread", "🧵", "ツリー"]): tags.append("スレッド")
+        tags.extend(rules.buzz_text_tags(text))
         if "?" in raw_text or "？" in raw_text: tags.append("問いかけ")
 
     # タイトルがある場合もチェック
     title = t.get("_title", "").lower()
     if title:
-        if any(w in title for w in ["方法", "まとめ", "入門", "コツ", "やり方"]): tags.append("ハウツー/まとめ")
-        if any(w in title for w in ["年収", "稼", "売上", "金持ち"]): tags.append("収益系")
-        if any(w in title for w in ["失敗", "倒産", "地獄"]): tags.append("体験談/リアル")
+        tags.extend(rules.buzz_title_tags(title))
 
     if sr >= 1.0: tags.append("高保存率")
     return list(dict.fromkeys(tags)) if tags else ["—"]  # 重複除去
@@ -178,47 +182,1065 @@ def detect_noise(t, target_langs=("ja", "en")):
     # ひらがな/カタカナがあれば日本語 → ノイズではない
     if _HAS_KANA.search(text):
         return None
-    for lang_code, pattern in NOISE_PATTERNS:
-        if pattern.search(text):
-            return lang_code
-    return None
+    return get_rules().match_noise(text)
 
 
-def load_and_dedupe(files, labels, title_map=None, exclude_ids=None, auto_noise=True):
-    all_tweets = []
-    noise_tweets = []
-    seen = set(exclude_ids or set())
-    per_label = {}
-    for f, label in zip(files, labels):
-        tweets = json.loads(Path(f).read_text())
-        deduped = []
-        for t in tweets:
+# ============================================================
+# ルールセット（話題・ノイズ・バズ要因タグ）
+# ============================================================
+#
+# TOPIC_RULES / NOISE_PATTERNS / BUZZ_*_RULES をまとめて1回だけ正規表現に
+# コンパイルする。--rules でJSON/YAMLファイルから差し替えでき、ファイルが
+# 更新されると次のレポートから再コンパイルする（長時間動くプロセス向け）。
+# 1レポートの間（rules_snapshot の中）はルールを差し替えないので、話題・
+# サマリー・xlsx が同じ版のルールで集計される。
+
+RULES_SCHEMA_VERSION = 1
+RULE_RELOAD_INTERVAL = 1.0  # 秒。レポートの外で照会したときのファイル更新チェックの間隔
+
+_SHORT_EN_RE = re.compile(r'^[a-z]{1,4}$')
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# ルールファイルの読み込み失敗として扱う例外（壊れた JSON/YAML・不正な正規表現・キー不足）
+RULE_LOAD_ERRORS = (OSError, ValueError, KeyError, TypeError, re.error) + ((yaml.YAMLError,) if yaml else ())
+
+
+def _keyword_regex(kw, word_boundary):
+    # 短いキーワード（4文字以下の英字のみ）はワードバウンダリで検索
+    if word_boundary and _SHORT_EN_RE.match(kw):
+        return r'\b' + re.escape(kw) + r'\b'
+    return re.escape(kw)
+
+
+def _default_rule_lists():
+    """モジュールの TOPIC_RULES / NOISE_PATTERNS / BUZZ_*_RULES を RuleSet の形にしたもの"""
+    return {
+        "topics": [(name, list(kws)) for name, kws in TOPIC_RULES],
+        "noise": [(lang, p.pattern, p.flags & re.IGNORECASE) for lang, p in NOISE_PATTERNS],
+        "buzz_text": [(tag, list(kws)) for tag, kws in BUZZ_TEXT_RULES],
+        "buzz_title": [(tag, list(kws)) for tag, kws in BUZZ_TITLE_RULES],
+    }
+
+
+class RuleSet:
+    """話題・ノイズ・バズ要因タグのルール。キーワードはルールごとに1本の正規表現にまとめる。
+    profile=True にするとキーワード単位のヒット数とマッチ時間を集計する（遅くなる）"""
+
+    def __init__(self, topics=None, noise=None, buzz_text=None, buzz_title=None, source=None):
+        defaults = _default_rule_lists()
+        self.topics = defaults["topics"] if topics is None else [(name, list(kws)) for name, kws in topics]
+        self.noise = defaults["noise"] if noise is None else [tuple(n) for n in noise]
+        self.buzz_text = defaults["buzz_text"] if buzz_text is None else [(tag, list(kws)) for tag, kws in buzz_text]
+        self.buzz_title = (defaults["buzz_title"] if buzz_title is None
+                           else [(tag, list(kws)) for tag, kws in buzz_title])
+        # モジュールの TOPIC_RULES 等から取った部分（後から差し替えられたら作り直す）
+        self.from_defaults = [name for name, v in (("topics", topics), ("noise", noise), ("buzz_text", buzz_text),
+                                                    ("buzz_title", buzz_title)) if v is None]
+        self.source = Path(source) if source else None
+        self.mtime_ns = self.source.stat().st_mtime_ns if self.source else None
+        self.profile = False
+        self.stats = {}  # (種別, ルール名, キーワード) → [照会数, ヒット数, ns]
+        self._checked_at = time.monotonic()
+        self._compile()
+
+    # --- 読み込み ---
+
+    @classmethod
+    def from_file(cls, path):
+        path = Path(path)
+        raw = path.read_text(encoding="utf-8")
+        if path.suffix in (".yaml", ".yml"):
+            if yaml is None:
+                raise ValueError("YAML のルールファイルには PyYAML が必要です（pip install pyyaml）")
+            spec = yaml.safe_load(raw)
+        else:
+            spec = json.loads(raw)
+        return cls.from_dict(spec, source=path)
+
+    @classmethod
+    def from_dict(cls, spec, source=None):
+        if not isinstance(spec, dict):
+            raise ValueError("ルールファイルのトップレベルはオブジェクトにしてください")
+        version = spec.get("version", RULES_SCHEMA_VERSION)
+        if version != RULES_SCHEMA_VERSION:
+            raise ValueError(f"未対応のルールスキーマ version: {version}")
+        buzz = spec.get("buzz_tags", {})
+
+        def pairs(items, key):
+            return None if items is None else [(r[key], r["keywords"]) for r in items]
+
+        noise = spec.get("noise")
+        return cls(
+            topics=pairs(spec.get("topics"), "name"),
+            noise=None if noise is None else [
+                (n["lang"], n["pattern"], re.IGNORECASE if "i" in n.get("flags", "") else 0) for n in noise
+            ],
+            buzz_text=pairs(buzz.get("text"), "tag"),
+            buzz_title=pairs(buzz.get("title"), "tag"),
+            source=source,
+        )
+
+    def to_dict(self):
+        return {
+            "version": RULES_SCHEMA_VERSION,
+            "topics": [{"name": n, "keywords": kws} for n, kws in self.topics],
+            "noise": [{"lang": lang, "pattern": p, "flags": "i" if f & re.IGNORECASE else ""}
+                      for lang, p, f in self.noise],
+            "buzz_tags": {
+                "text": [{"tag": t, "keywords": kws} for t, kws in self.buzz_text],
+                "title": [{"tag": t, "keywords": kws} for t, kws in self.buzz_title],
+            },
+        }
+
+    def _compile(self):
+        def group(rules, word_boundary):
+            compiled = []
+            for name, kws in rules:
+                rx = re.compile("|".join(_keyword_regex(kw, word_boundary) for kw in kws)) if kws else None
+                kw_res = [(kw, re.compile(_keyword_regex(kw, word_boundary))) for kw in kws]
+                compiled.append((name, rx, kw_res))
+            return compiled
+
+        self._topics = group(self.topics, word_boundary=True)
+        self._buzz_text = group(self.buzz_text, word_boundary=False)
+        self._buzz_title = group(self.buzz_title, word_boundary=False)
+        self._noise = [(lang, re.compile(p, f)) for lang, p, f in self.noise]
+
+    def defaults_changed(self):
+        """モジュールの TOPIC_RULES / NOISE_PATTERNS / BUZZ_*_RULES が、このルールセットを作った後に
+        差し替え・変更されたか"""
+        if not self.from_defaults:
+            return False
+        defaults = _default_rule_lists()
+        return any(getattr(self, name) != defaults[name] for name in self.from_defaults)
+
+    def maybe_reload(self, force=False):
+        """ルールファイルが更新されていれば再読み込み。読み込めなければ今のルールを使い続ける。
+        force=False なら RULE_RELOAD_INTERVAL 秒に1回だけ確かめる"""
+        if self.source is None:
+            return False
+        now = time.monotonic()
+        if not force and now - self._checked_at < RULE_RELOAD_INTERVAL:
+            return False
+        self._checked_at = now
+        mtime = None
+        try:
+            mtime = self.source.stat().st_mtime_ns
+            if mtime == self.mtime_ns:
+                return False
+            fresh = RuleSet.from_file(self.source)
+        except RULE_LOAD_ERRORS as e:
+            # 壊れた版の mtime も覚えておき、直るまで毎回読み直して同じエラーを出さない
+            if mtime is not None:
+                self.mtime_ns = mtime
+            print(f"[ルール] 再読み込み失敗、現在のルールを継続: {e}", file=sys.stderr)
+            return False
+        self.topics, self.noise = fresh.topics, fresh.noise
+        self.buzz_text, self.buzz_title = fresh.buzz_text, fresh.buzz_title
+        self.from_defaults = fresh.from_defaults
+        self.mtime_ns = fresh.mtime_ns
+        self._compile()
+        print(f"[ルール] {self.source} を再読み込み", file=sys.stderr)
+        return True
+
+    # --- 照会 ---
+
+    def _matches(self, kind, compiled, text):
+        if not self.profile:
+            return [name for name, rx, _ in compiled if rx is not None and rx.search(text)]
+        matched = []
+        for name, _, kw_res in compiled:
+            hit = False
+            for kw, rx in kw_res:
+                start = time.perf_counter_ns()
+                found = rx.search(text) is not None
+                st = self.stats.setdefault((kind, name, kw), [0, 0, 0])
+                st[0] += 1
+                st[1] += found
+                st[2] += time.perf_counter_ns() - start
+                if found:
+                    hit = True
+                    break
+            if hit:
+                matched.append(name)
+        return matched
+
+    def match_topics(self, text):
+        """小文字化済みテキストに当てはまる話題名のリスト"""
+        return self._matches("topic", self._topics, text)
+
+    def buzz_text_tags(self, text):
+        return self._matches("buzz_text", self._buzz_text, text)
+
+    def buzz_title_tags(self, title):
+        return self._matches("buzz_title", self._buzz_title, title)
+
+    def match_noise(self, text):
+        for lang, rx in self._noise:
+            if not self.profile:
+                if rx.search(text):
+                    return lang
+                continue
+            start = time.perf_counter_ns()
+            found = rx.search(text) is not None
+            st = self.stats.setdefault(("noise", lang, rx.pattern), [0, 0, 0])
+            st[0] += 1
+            st[1] += found
+            st[2] += time.perf_counter_ns() - start
+            if found:
+                return lang
+        return None
+
+    def topic_names(self):
+        return [name for name, _ in self.topics]
+
+    # --- 統計 ---
+
+    def stats_report(self, slowest=10):
+        """ルール別のヒット数・マッチ時間と、一度もヒットしなかったキーワードの一覧"""
+        lines = ["[ルール統計] 種別 / ルール / キーワード: ヒット/照会, 合計ms"]
+        rows = sorted(self.stats.items(), key=lambda x: x[1][2], reverse=True)
+        for (kind, name, kw), (calls, hits, ns) in rows[:slowest]:
+            lines.append(f"  {kind} / {name} / {kw}: {hits}/{calls}, {ns / 1e6:.2f}ms")
+        never = [(kind, name, kw) for (kind, name, kw), (calls, hits, _) in self.stats.items() if calls and not hits]
+        if never:
+            lines.append(f"[ルール統計] 一度もヒットしなかったキーワード {len(never)}件:")
+            for kind, name, kw in never:
+                lines.append(f"  {kind} / {name} / {kw}")
+        return "\n".join(lines)
+
+
+_active_rules = None
+_snapshot_depth = 0  # rules_snapshot の入れ子の深さ（>0 の間はルールを差し替えない）
+
+def refresh_rules(force=True):
+    """レポートの合間に呼ぶ: ルールファイルの更新と TOPIC_RULES 等の差し替えを反映して返す"""
+    global _active_rules
+    old = _active_rules
+    if old is None:
+        _active_rules = RuleSet()
+    elif old.defaults_changed():
+        # TOPIC_RULES 等から取った部分だけ取り直し、ファイル・引数で渡された部分はそのまま
+        parts = {name: None if name in old.from_defaults else getattr(old, name)
+                 for name in ("topics", "noise", "buzz_text", "buzz_title")}
+        _active_rules = RuleSet(**parts)
+        _active_rules.source, _active_rules.mtime_ns = old.source, old.mtime_ns
+        _active_rules.profile, _active_rules.stats = old.profile, old.stats
+    else:
+        _active_rules.maybe_reload(force)
+    return _active_rules
+
+def get_rules():
+    """現在のルールセット。レポートの途中（rules_snapshot の中）なら固定した版を返し、
+    外から呼ばれたときは更新・差し替えを反映してから返す"""
+    if _snapshot_depth and _active_rules is not None:
+        return _active_rules
+    return refresh_rules(force=False)
+
+def set_rules(rules):
+    global _active_rules
+    _active_rules = rules
+
+@contextmanager
+def rules_snapshot():
+    """この中の集計は同じ版のルールを使う（1レポート分）。いちばん外側に入るときだけ
+    ルールファイルの更新と TOPIC_RULES 等の差し替えを反映する。
+    load_and_dedupe → generate_md → generate_xlsx を別々に呼ぶときは全体をこれで囲む"""
+    global _snapshot_depth
+    if not _snapshot_depth:
+        refresh_rules()
+    _snapshot_depth += 1
+    try:
+        yield _active_rules
+    finally:
+        _snapshot_depth -= 1
+
+def with_rules_snapshot(fn):
+    """fn の実行中（ジェネレータなら最後まで）を rules_snapshot で囲むデコレータ"""
+    if inspect.isgeneratorfunction(fn):
+        @wraps(fn)
+        def gen(*args, **kwargs):
+            with rules_snapshot():
+                yield from fn(*args, **kwargs)
+        return gen
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with rules_snapshot():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+# ============================================================
+# バイナリコーパス（mmap）
+# ============================================================
+#
+# レイアウト: MAGIC | 各セクション（8バイト境界） | ヘッダJSON | ヘッダ長(uint64) | MAGIC
+#   - 数値カラム: int64 固定長配列（いいね等の metrics + フォロワー数 + ファイル番号 + raw フラグ）
+#   - 文字列カラム: uint64 オフセット配列(n+1) + UTF-8 blob
+# 読み込み時は mmap して触ったフィールドだけデコードする。
+# カラムで元の値を表せないフィールド（metrics の他のキー・欠けたキー・int 以外の値、
+# 空文字や str 以外の文字列フィールド、キー自体がないもの）は raw フラグを立てて
+# 元の値を _extra（JSON）に入れるので、JSON から読んだ dict と同じものが返る。
+
+CORPUS_MAGIC = b"XRCORP01"
+CORPUS_VERSION = 2
+CORPUS_METRIC_FIELDS = ("likes", "retweets", "replies", "quotes", "impressions", "bookmarks")
+CORPUS_INT_FIELDS = CORPUS_METRIC_FIELDS + ("author_followers", "_src", "_raw")
+CORPUS_STR_FIELDS = ("id", "text", "_title", "username", "tweet_url", "account_url",
+                     "post_type", "conversation_id", "created_at", "_extra")
+# 空文字でも「値あり」として扱うフィールド（それ以外は空 = キーなし）
+_CORPUS_REQUIRED_STR = ("id", "text")
+_CORPUS_FIXED_KEYS = set(CORPUS_STR_FIELDS) | {"metrics", "author_followers", "_label"}
+# raw フラグのビット位置（ビットが立っていれば値は _extra 側にある）
+_CORPUS_RAW_BITS = {f: 1 << i for i, f in enumerate(
+    ("metrics", "author_followers") + tuple(f for f in CORPUS_STR_FIELDS if f != "_extra"))}
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def _is_int64(v):
+    return type(v) is int and _INT64_MIN <= v <= _INT64_MAX
+
+
+def _corpus_raw_fields(t):
+    """カラムでは元の値を表せないフィールド名のリスト"""
+    raw = []
+    m = t.get("metrics")
+    if not (isinstance(m, dict) and m.keys() == set(CORPUS_METRIC_FIELDS) and all(map(_is_int64, m.values()))):
+        raw.append("metrics")
+    if not _is_int64(t.get("author_followers")):
+        raw.append("author_followers")
+    for f in CORPUS_STR_FIELDS:
+        if f == "_extra":
+            continue
+        if f not in t:
+            if f in _CORPUS_REQUIRED_STR:
+                raw.append(f)
+        elif type(t[f]) is not str or (not t[f] and f not in _CORPUS_REQUIRED_STR):
+            raw.append(f)
+    return raw
+
+
+def _source_signature(files):
+    """入力ファイルの同一性判定用（パス・サイズ・mtime）"""
+    sig = []
+    for f in files:
+        st = Path(f).stat()
+        sig.append({"path": str(Path(f).resolve()), "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    return sig
+
+
+def write_corpus(path, records, files):
+    """(file_idx, tweet) のリストをバイナリコーパスとして書き出す"""
+    n = len(records)
+    sections = {}
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as fh:
+        fh.write(CORPUS_MAGIC)
+
+        def put(name, data):
+            pos = fh.tell()
+            sections[name] = [pos, len(data)]
+            fh.write(data)
+            fh.write(b"\0" * (-fh.tell() % 8))
+
+        raws = [_corpus_raw_fields(t) for _, t in records]
+        for field in CORPUS_INT_FIELDS:
+            col = array("q", bytes(8 * n))
+            for i, (src, t) in enumerate(records):
+                if field == "_src":
+                    col[i] = src
+                elif field == "_raw":
+                    col[i] = sum(_CORPUS_RAW_BITS[f] for f in raws[i])
+                elif field == "author_followers":
+                    v = t.get("author_followers")
+                    col[i] = v if _is_int64(v) else 0
+                else:
+                    v = (t.get("metrics") or {}).get(field)
+                    col[i] = v if _is_int64(v) else 0
+            put(field, col.tobytes())
+
+        for field in CORPUS_STR_FIELDS:
+            offsets = array("Q", [0])
+            blob = bytearray()
+            for (_, t), raw in zip(records, raws):
+                if field == "_extra":
+                    extra = {k: v for k, v in t.items() if k not in _CORPUS_FIXED_KEYS or (k in raw and k != "_label")}
+                    value = json.dumps(extra, ensure_ascii=False, separators=(",", ":")) if extra else ""
+                else:
+                    value = t.get(field) if field not in raw else ""
+                    value = value or ""
+                blob += str(value).encode("utf-8")
+                offsets.append(len(blob))
+            put(field + ".off", offsets.tobytes())
+            put(field + ".blob", bytes(blob))
+
+        header = json.dumps({
+            "version": CORPUS_VERSION, "count": n, "sources": _source_signature(files),
+            "int_fields": list(CORPUS_INT_FIELDS), "str_fields": list(CORPUS_STR_FIELDS),
+            "sections": sections,
+        }, ensure_ascii=False).encode("utf-8")
+        fh.write(header)
+        fh.write(struct.pack("<Q", len(header)))
+        fh.write(CORPUS_MAGIC)
+    os.replace(tmp, path)
+
+
+class Corpus:
+    """mmap したバイナリコーパス。フィールドは触れた時点で読み出す"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fh = open(self.path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[:8] != CORPUS_MAGIC or mm[-8:] != CORPUS_MAGIC:
+            self.close()
+            raise ValueError(f"not a corpus file: {path}")
+        (header_len,) = struct.unpack("<Q", mm[-16:-8])
+        self.header = json.loads(mm[-16 - header_len:-16].decode("utf-8"))
+        if self.header.get("version") != CORPUS_VERSION:
+            self.close()
+            raise ValueError(f"unsupported corpus version: {self.header.get('version')}")
+        self.count = self.header["count"]
+        view = memoryview(mm)
+        sec = self.header["sections"]
+
+        def region(name, fmt=None):
+            off, length = sec[name]
+            v = view[off:off + length]
+            return v.cast(fmt) if fmt else v
+
+        self._ints = {f: region(f, "q") for f in self.header["int_fields"]}
+        self._offsets = {f: region(f + ".off", "Q") for f in self.header["str_fields"]}
+        self._blob_base = {f: sec[f + ".blob"][0] for f in self.header["str_fields"]}
+        self._view = view
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return CorpusTweet(self, i)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield CorpusTweet(self, i)
+
+    def matches(self, files):
+        return self.header.get("sources") == _source_signature(files)
+
+    def column(self, field):
+        """数値カラムを memoryview(int64) で返す"""
+        return self._ints[field]
+
+    def string(self, field, i):
+        off = self._offsets[field]
+        base = self._blob_base[field]
+        return self._mm[base + off[i]:base + off[i + 1]].decode("utf-8")
+
+    def close(self):
+        for d in (getattr(self, "_ints", {}), getattr(self, "_offsets", {})):
+            for v in d.values():
+                v.release()
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+        self._mm.close()
+        self._fh.close()
+
+
+class CorpusTweet(MutableMapping):
+    """コーパス上の1ツイート。dict と同じインターフェースで遅延デコード"""
+
+    __slots__ = ("_corpus", "_i", "_over", "_extra")
+
+    def __init__(self, corpus, i):
+        self._corpus = corpus
+        self._i = i
+        self._over = {}
+        self._extra = None
+
+    def __getitem__(self, key):
+        over = self._over
+        if key in over:
+            value = over[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        c, i = self._corpus, self._i
+        bit = _CORPUS_RAW_BITS.get(key)
+        if bit is not None and c._ints["_raw"][i] & bit:
+            value = self._extras()[key]  # 元の値は _extra 側（なければ KeyError = キーなし）
+        elif key == "metrics":
+            value = {f: c._ints[f][i] for f in CORPUS_METRIC_FIELDS}
+        elif key == "author_followers":
+            value = c._ints[key][i]
+        elif key in CORPUS_STR_FIELDS and key != "_extra":
+            value = c.string(key, i)
+            if not value and key not in _CORPUS_REQUIRED_STR:
+                raise KeyError(key)
+        else:
+            return self._extras()[key]
+        over[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._over[key] = value
+
+    def __delitem__(self, key):
+        self[key]
+        self._over[key] = _DELETED
+
+    def _extras(self):
+        if self._extra is None:
+            raw = self._corpus.string("_extra", self._i)
+            self._extra = json.loads(raw) if raw else {}
+        return self._extra
+
+    def _keys(self):
+        keys = ["metrics", "author_followers"]
+        keys.extend(f for f in CORPUS_STR_FIELDS if f != "_extra")
+        keys.extend(self._extras())
+        keys.extend(self._over)
+        return [k for k in dict.fromkeys(keys) if k in self]
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __repr__(self):
+        return f"CorpusTweet({self._corpus.path.name}#{self._i})"
+
+
+_DELETED = object()
+
+
+def open_corpus(path, files):
+    """入力ファイルと一致するコーパスがあれば開く。なければ None"""
+    if not path or not Path(path).exists():
+        return None
+    try:
+        corpus = Corpus(path)
+    except (ValueError, OSError, KeyError) as e:
+        print(f"[コーパス] 読み込み失敗、再生成します: {e}", file=sys.stderr)
+        return None
+    if not corpus.matches(files):
+        print(f"[コーパス] 入力ファイルが変更されたため再生成: {path}", file=sys.stderr)
+        corpus.close()
+        return None
+    return corpus
+
+
+def corpus_source_files(path):
+    """コーパスのヘッダに記録された入力ファイルのパス（作成時の順）。元の JSON がなくても読める"""
+    corpus = Corpus(path)
+    try:
+        return [src["path"] for src in corpus.header.get("sources", [])]
+    finally:
+        corpus.close()
+
+
+def iter_source_tweets(files, seen=None):
+    """JSONファイル群を読み、ID重複除去 + post_type修正済みの (file_idx, tweet) を返す。
+    seen: 既出IDの集合（add / in が使えれば BloomFilter でもよい）"""
+    seen = set() if seen is None else seen
+    for idx, f in enumerate(files):
+        for t in json.loads(Path(f).read_text()):
             if t["id"] not in seen:
                 seen.add(t["id"])
-                t["_label"] = label
                 fix_post_type(t)
-                # タイトルマッピングを適用
-                if title_map:
-                    tid = t["id"]
-                    url = t.get("tweet_url", "")
-                    if tid in title_map:
-                        t["_title"] = title_map[tid]
-                    elif url in title_map:
-                        t["_title"] = title_map[url]
-                # ノイズ自動検出
-                if auto_noise:
-                    noise_lang = detect_noise(t)
-                    if noise_lang:
-                        noise_tweets.append((t, noise_lang))
-                        continue
-                deduped.append(t)
-                all_tweets.append(t)
+                yield idx, t
+
+
+def _iter_corpus_tweets(corpus):
+    src = corpus.column("_src")
+    for i in range(len(corpus)):
+        yield src[i], corpus[i]
+
+
+# ============================================================
+# X記事タイトルストア（SQLite）
+# ============================================================
+
+_TWEET_URL_HOSTS = {"x.com", "www.x.com", "mobile.x.com", "twitter.com", "www.twitter.com", "mobile.twitter.com"}
+
+def normalize_tweet_url(url):
+    """ツイートURLを正規化（twitter.com→x.com、https化、クエリ/末尾スラッシュ除去）。
+    解釈できない URL はそのまま返す"""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip()
+    host = parts.netloc.lower()
+    path = parts.path
+    if host in _TWEET_URL_HOSTS:
+        host = "x.com"
+        path = path.lower()  # ユーザー名は大文字小文字を区別しない
+    return f"https://{host}{path.rstrip('/')}"
+
+def title_key(key):
+    """タイトルマップのキー（tweet id or URL）をストアのキーに変換"""
+    key = str(key).strip()
+    return key if key.isdigit() else normalize_tweet_url(key)
+
+
+class TitleStore:
+    """tweet id / 正規化URL → タイトル の永続ストア。実行をまたいで蓄積する"""
+
+    BATCH_SIZE = 500  # SQLite のプレースホルダ上限より小さく
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path))
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS titles ("
+            " key TEXT PRIMARY KEY, title TEXT NOT NULL, updated_at TEXT NOT NULL)"
+        )
+        # --fetch-titles の取得結果（正規化URL → タイトル、失敗は空文字）
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS url_titles ("
+            " url TEXT PRIMARY KEY, title TEXT NOT NULL, fetched_at TEXT NOT NULL)"
+        )
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM titles").fetchone()[0]
+
+    def update(self, mapping):
+        """{tweet_id or url: title} を登録。登録件数を返す"""
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = [(title_key(k), v, now) for k, v in mapping.items() if v]
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO titles VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def lookup_many(self, keys):
+        """キー群をまとめて引く。{key: title}"""
+        keys = list(dict.fromkeys(k for k in keys if k))
+        found = {}
+        for i in range(0, len(keys), self.BATCH_SIZE):
+            chunk = keys[i:i + self.BATCH_SIZE]
+            marks = ",".join("?" * len(chunk))
+            found.update(self._db.execute(
+                f"SELECT key, title FROM titles WHERE key IN ({marks})", chunk))
+        return found
+
+    def lookup_tweets(self, tweets):
+        """ツイート群の id と正規化 tweet_url を1回のバッチで引く"""
+        keys = []
+        for t in tweets:
+            keys.append(t["id"])
+            url = t.get("tweet_url", "")
+            if url:
+                keys.append(normalize_tweet_url(url))
+        return self.lookup_many(keys)
+
+    def lookup_urls(self, urls, retry_after):
+        """取得済みURLのタイトル {url: title}。失敗（空文字）は retry_after 秒を過ぎたら未取得扱い"""
+        urls = list(dict.fromkeys(urls))
+        cutoff = (datetime.now() - timedelta(seconds=retry_after)).isoformat(timespec="seconds")
+        found = {}
+        for i in range(0, len(urls), self.BATCH_SIZE):
+            chunk = urls[i:i + self.BATCH_SIZE]
+            marks = ",".join("?" * len(chunk))
+            found.update(self._db.execute(
+                f"SELECT url, title FROM url_titles WHERE url IN ({marks}) AND (title != '' OR fetched_at > ?)",
+                chunk + [cutoff]))
+        return found
+
+    def update_urls(self, mapping):
+        """{正規化URL: title} を登録（空文字は取得失敗として記録）"""
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO url_titles VALUES (?, ?, ?)",
+                                 [(url, title, now) for url, title in mapping.items()])
+
+    def digest(self):
+        """保存内容のハッシュ（再現可能モードのキャッシュキー用）"""
+        h = hashlib.sha256()
+        for key, title in self._db.execute("SELECT key, title FROM titles ORDER BY key"):
+            h.update(f"{key}\0{title}\0".encode("utf-8"))
+        for url, title in self._db.execute("SELECT url, title FROM url_titles WHERE title != '' ORDER BY url"):
+            h.update(f"url\0{url}\0{title}\0".encode("utf-8"))
+        return h.digest()
+
+    def close(self):
+        self._db.close()
+
+
+# ============================================================
+# タイトル自動取得（--fetch-titles）
+# ============================================================
+#
+# タイトル未取得の X記事と、title が空の url_meta の expanded_url を asyncio で
+# 並行取得する。接続はホストごとにプールして keep-alive で使い回し、同一ホストへの
+# 同時接続数を制限する。結果（失敗も含む）はタイトルストアに残し、次回は取りに行かない。
+
+FETCH_CONCURRENCY = 16        # 全体の同時リクエスト数
+FETCH_PER_HOST = 4            # 同一ホストへの同時リクエスト数
+FETCH_TIMEOUT = 10.0          # 1リクエストの秒数（同一ホストの枠を取ってから数える）
+FETCH_MAX_BYTES = 256 * 1024  # タイトル探索に読む本文の上限
+FETCH_MAX_REDIRECTS = 3
+FETCH_RETRY_AFTER = 24 * 3600  # 取得に失敗した URL を再試行するまでの秒数
+FETCH_USER_AGENT = "Mozilla/5.0 (compatible; x-research-report/1.0)"
+# JS なしで取るとどのページでも返ってくるタイトル（記事のタイトルとしては使わない）
+FETCH_GENERIC_TITLES = {"x", "twitter", "javascript is not available.", "just a moment...", "404 not found"}
+
+_OG_TITLE_RE = re.compile(
+    r'<meta\s[^>]*(?:property|name)\s*=\s*["\'](?:og|twitter):title["\'][^>]*>', re.I)
+_META_CONTENT_RE = re.compile(r'content\s*=\s*(["\'])(.*?)\1', re.I | re.S)
+_TITLE_TAG_RE = re.compile(r'<title[^>]*>(.*?)</title>', re.I | re.S)
+_CHARSET_RE = re.compile(rb'charset\s*=\s*["\']?([\w-]+)', re.I)
+
+
+def extract_title(body, content_type=""):
+    """HTML（bytes）から og:title / twitter:title、なければ <title> を取り出す。なければ空文字"""
+    m = _CHARSET_RE.search(content_type.encode("latin-1", "ignore")) or _CHARSET_RE.search(body[:2048])
+    charset = m.group(1).decode("ascii") if m else "utf-8"
+    try:
+        html_text = body.decode(charset, errors="replace")
+    except LookupError:
+        html_text = body.decode("utf-8", errors="replace")
+    m = _OG_TITLE_RE.search(html_text)
+    title = ""
+    if m:
+        c = _META_CONTENT_RE.search(m.group(0))
+        title = c.group(2) if c else ""
+    if not title:
+        m = _TITLE_TAG_RE.search(html_text)
+        title = m.group(1) if m else ""
+    return " ".join(html.unescape(title).split())
+
+
+class HttpPool:
+    """(scheme, host, port) ごとの keep-alive 接続プール。1つのイベントループ内で使う"""
+
+    def __init__(self, per_host=FETCH_PER_HOST):
+        self.per_host = per_host
+        self._idle = defaultdict(list)
+        self._limits = {}
+        self._ssl = None
+
+    def limit(self, key):
+        if key not in self._limits:
+            self._limits[key] = asyncio.Semaphore(self.per_host)
+        return self._limits[key]
+
+    async def acquire(self, key):
+        """(reader, writer, 再利用かどうか)"""
+        idle = self._idle[key]
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        if scheme == "https" and self._ssl is None:
+            self._ssl = ssl.create_default_context()
+        reader, writer = await asyncio.open_connection(
+            host, port, ssl=self._ssl if scheme == "https" else None)
+        return reader, writer, False
+
+    def release(self, key, reader, writer, reusable):
+        if reusable:
+            self._idle[key].append((reader, writer))
+        else:
+            writer.close()
+
+    def close(self):
+        for conns in self._idle.values():
+            for _, writer in conns:
+                writer.close()
+        self._idle.clear()
+
+
+async def _read_body(reader, headers, status):
+    """本文を最大 FETCH_MAX_BYTES 読む。(本文, 最後まで読み切ったか)"""
+    if 100 <= status < 200 or status in (204, 304):
+        return b"", True  # 本文を持たないレスポンス
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks, size = [], 0
+        while True:
+            line = await reader.readline()
+            n = int(line.split(b";")[0].strip() or b"0", 16)
+            if n == 0:
+                await reader.readline()  # トレーラ（なし）の終端
+                return b"".join(chunks), True
+            if size + n > FETCH_MAX_BYTES:
+                chunks.append(await reader.read(FETCH_MAX_BYTES - size))
+                return b"".join(chunks), False
+            chunks.append(await reader.readexactly(n))
+            size += n
+            await reader.readline()
+    if "content-length" in headers:
+        length = int(headers["content-length"])
+        if length > FETCH_MAX_BYTES:
+            return await reader.readexactly(FETCH_MAX_BYTES), False
+        return await reader.readexactly(length), True
+    # 長さ不明 → 接続が閉じるまで（上限まで）
+    return await reader.read(FETCH_MAX_BYTES), False
+
+
+async def _http_get(pool, url, timeout=None):
+    """1回の GET。(status, headers, body)。再利用した接続が切れていたら1回だけ張り直す。
+    timeout は同一ホストの枠を取ってから数える（順番待ちの時間は含めない）"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"未対応のURL: {url}")
+    key = (scheme, parts.hostname, parts.port or (443 if scheme == "https" else 80))
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    host = parts.hostname + (f":{parts.port}" if parts.port else "")
+    request = (
+        f"GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: {FETCH_USER_AGENT}\r\n"
+        f"Accept: text/html,*/*;q=0.8\r\nAccept-Encoding: identity\r\nConnection: keep-alive\r\n\r\n"
+    ).encode("latin-1", "ignore")
+    async with pool.limit(key):
+        return await asyncio.wait_for(_http_request(pool, key, request), timeout)
+
+
+async def _http_request(pool, key, request):
+    """_http_get の本体（同一ホストの枠を取った後に呼ぶ）"""
+    for attempt in range(2):
+        reader, writer, reused = await pool.acquire(key)
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionResetError("接続が閉じられました")
+            fields = status_line.split(None, 2)
+            if len(fields) < 2 or not fields[0].startswith(b"HTTP/") or not fields[1].isdigit():
+                raise ValueError(f"不正なステータス行: {status_line[:80]!r}")
+            status = int(fields[1])
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body, complete = await _read_body(reader, headers, status)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            if reused and attempt == 0:
+                continue
+            raise
+        except BaseException:
+            writer.close()
+            raise
+        keep = complete and headers.get("connection", "").lower() != "close"
+        pool.release(key, reader, writer, keep)
+        return status, headers, body
+
+
+async def _fetch_title(pool, url, timeout=None):
+    """リダイレクトをたどってタイトルを取る。失敗は空文字、タイムアウトは None（記録せず次回また取る）"""
+    try:
+        for _ in range(FETCH_MAX_REDIRECTS + 1):
+            status, headers, body = await _http_get(pool, url, timeout)
+            if status in (301, 302, 303, 307, 308) and headers.get("location"):
+                url = urljoin(url, headers["location"])
+                continue
+            if status != 200:
+                return ""
+            title = extract_title(body, headers.get("content-type", ""))
+            return "" if title.lower() in FETCH_GENERIC_TITLES else title
+    except asyncio.TimeoutError:
+        print(f"[タイトル取得] タイムアウト: {url}", file=sys.stderr)
+        return None
+    except Exception as e:
+        # 1URLの失敗で他の取得を止めない（キャンセルは BaseException なのでそのまま伝わる）
+        print(f"[タイトル取得] 失敗: {url} ({type(e).__name__}: {e})", file=sys.stderr)
+    return ""
+
+
+class TitleFetcher:
+    """タイトル未取得の URL をまとめて非同期取得する。結果はタイトルストアにキャッシュする。
+    enrich(tweets) を load のバッチごとに呼ぶ（イベントループと接続プールはバッチをまたいで使い回す）。
+    offline=True ならキャッシュ済みのタイトルを当てるだけで取りに行かない"""
+
+    def __init__(self, title_store, concurrency=FETCH_CONCURRENCY, per_host=FETCH_PER_HOST, timeout=FETCH_TIMEOUT,
+                 offline=False):
+        self.store = title_store
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.offline = offline
+        self.fetched = 0
+        self.found = 0
+        self._loop = None
+        self._pool = HttpPool(per_host)
+
+    def fetch_many(self, urls):
+        """{url: タイトル（取れなければ空文字）}。キャッシュ済みの URL は取りに行かない"""
+        keys = {url: normalize_url(url) for url in urls}
+        cached = self.store.lookup_urls(keys.values(), FETCH_RETRY_AFTER) if self.store is not None else {}
+        missing = list(dict.fromkeys(url for url, key in keys.items() if key not in cached))
+        fresh = {}
+        if missing and not self.offline:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+            fresh = self._loop.run_until_complete(self._gather(missing))
+        if self.store is not None and fresh:
+            # タイムアウト（None）は一時的な失敗なので記録しない
+            self.store.update_urls({keys[url]: title for url, title in fresh.items() if title is not None})
+        self.fetched += len(fresh)
+        self.found += sum(1 for title in fresh.values() if title)
+        return {url: fresh.get(url) or cached.get(key, "") for url, key in keys.items()}
+
+    async def _gather(self, urls):
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def one(url):
+            async with sem:
+                return url, await _fetch_title(self._pool, url, self.timeout)
+
+        return dict(await asyncio.gather(*(one(url) for url in urls)))
+
+    def enrich(self, tweets):
+        """X記事の _title と url_meta の title を埋める（get_display_text より前に呼ぶ）。
+        取得したタイトルは URL 単位（url_titles）にだけ保存し、tweet id のタイトルとしては登録しない"""
+        articles, metas = [], []
+        for t in tweets:
+            if (t.get("post_type") == "x_article" and not t.get("_title")
+                    and re.match(r'^https?://t\.co/\S+$', t.get("text", "").strip())):
+                url = get_article_url(t)
+                if url:
+                    articles.append((t, url))
+            urls = [um.get("expanded_url", "") for um in t.get("url_meta", []) if not um.get("title")]
+            urls = [eu for eu in urls if eu and not is_internal_url(eu)]
+            if urls:
+                metas.append((t, urls))
+        if not articles and not metas:
+            return
+        titles = self.fetch_many([url for _, url in articles] + [url for _, urls in metas for url in urls])
+        for t, url in articles:
+            if titles.get(url):
+                t["_title"] = titles[url]
+        for t, _ in metas:
+            t["url_meta"] = [
+                dict(um, title=titles[um.get("expanded_url", "")])
+                if not um.get("title") and titles.get(um.get("expanded_url", "")) else um
+                for um in t["url_meta"]
+            ]
+
+    def close(self):
+        if self._loop is None:
+            return
+        self._pool.close()
+        # close() した transport の後始末を回してからループを閉じる
+        self._loop.run_until_complete(asyncio.sleep(0))
+        self._loop.close()
+
+
+# タイトルストア照会・逐次処理の単位（ファイル内をこの件数ずつまとめて処理する）
+LOAD_BATCH_SIZE = 5000
+
+@with_rules_snapshot
+def iter_loaded_tweets(files, labels, title_map=None, exclude_ids=None, auto_noise=True, corpus_path=None,
+                       title_store=None, seen=None, on_noise=None, fetcher=None):
+    """load_and_dedupe の逐次版。ラベル・タイトル付与とノイズ除去を済ませた (file_idx, tweet) を返す。
+    ノイズと判定したツイートは on_noise(tweet, lang_code) に渡して読み飛ばす。
+    fetcher（TitleFetcher）があれば、残ったツイートの未取得タイトルをバッチごとに取得する。
+    files が空で corpus_path があれば、元の JSON なしでコーパスだけから読む
+    （labels はヘッダのファイル順。corpus_source_files を参照）"""
+    exclude_ids = set(exclude_ids or set())
+
+    if corpus_path and not files:
+        corpus = Corpus(corpus_path)
+        print(f"[コーパス] {corpus_path} から読み込み（{len(corpus)}件）", file=sys.stderr)
+        source = _iter_corpus_tweets(corpus)
+    elif corpus_path and (corpus := open_corpus(corpus_path, files)) is not None:
+        print(f"[コーパス] {corpus_path} を再利用（{len(corpus)}件）", file=sys.stderr)
+        source = _iter_corpus_tweets(corpus)
+    elif corpus_path:
+        records = list(iter_source_tweets(files, seen))
+        write_corpus(corpus_path, records, files)
+        print(f"[コーパス] {corpus_path} に保存（{len(records)}件）", file=sys.stderr)
+        source = iter(records)
+    else:
+        source = iter_source_tweets(files, seen)
+
+    for idx, group in groupby(source, key=lambda x: x[0]):
+        tweets = (t for _, t in group if not (exclude_ids and t["id"] in exclude_ids))
+        for batch in _batched(tweets, LOAD_BATCH_SIZE):
+            yield from _prepare_batch(idx, batch, labels, title_map, title_store, auto_noise, on_noise, fetcher)
+
+
+def _batched(iterable, n):
+    it = iter(iterable)
+    while batch := list(islice(it, n)):
+        yield batch
+
+
+def _prepare_batch(idx, batch, labels, title_map, title_store, auto_noise, on_noise, fetcher=None):
+    stored = title_store.lookup_tweets(batch) if title_store is not None else {}
+    kept = []
+    for t in batch:
+        t["_label"] = labels[idx]
+        # タイトルマッピングを適用（--titles 優先、なければタイトルストア）
+        tid = t["id"]
+        url = t.get("tweet_url", "")
+        if title_map:
+            if tid in title_map:
+                t["_title"] = title_map[tid]
+            elif url in title_map:
+                t["_title"] = title_map[url]
+        if stored and not t.get("_title"):
+            title = stored.get(tid) or (url and stored.get(normalize_tweet_url(url)))
+            if title:
+                t["_title"] = title
+        # ノイズ自動検出
+        if auto_noise:
+            noise_lang = detect_noise(t)
+            if noise_lang:
+                if on_noise:
+                    on_noise(t, noise_lang)
+                continue
+        kept.append(t)
+    if fetcher is not None:
+        fetcher.enrich(kept)
+    for t in kept:
+        yield idx, t
+
+
+def format_noise(t, lang):
+    return f"  {lang} @{t.get('username','?')} ({t['metrics']['likes']}L): {t['text'][:50]}"
+
+
+@with_rules_snapshot
+def load_and_dedupe(files, labels, title_map=None, exclude_ids=None, auto_noise=True, corpus_path=None,
+                    title_store=None, seen=None, fetcher=None):
+    all_tweets = []
+    noise_tweets = []
+    per_file = [[] for _ in labels]
+
+    for idx, t in iter_loaded_tweets(
+        files, labels, title_map, exclude_ids, auto_noise, corpus_path, title_store, seen,
+        on_noise=lambda t, lang: noise_tweets.append((t, lang)), fetcher=fetcher,
+    ):
+        per_file[idx].append(t)
+        all_tweets.append(t)
+
+    per_label = {}
+    for label, deduped in zip(labels, per_file):
         per_label[label] = deduped
 
     if noise_tweets:
         print(f"[自動ノイズ除去] {len(noise_tweets)}件を除外:", file=sys.stderr)
         for t, lang in noise_tweets:
-            print(f"  {lang} @{t.get('username','?')} ({t['metrics']['likes']}L): {t['text'][:50]}", file=sys.stderr)
+            print(format_noise(t, lang), file=sys.stderr)
 
     return all_tweets, per_label
 
@@ -236,8 +1258,8 @@ def analyze_topics(all_tweets):
     # いいね合計順
     return sorted(topic_tweets.items(), key=lambda x: sum(t["metrics"]["likes"] for t in x[1]), reverse=True)
 
-def analyze_accounts(all_tweets):
-    """アカウント別プロファイル"""
+def analyze_accounts(all_tweets, graph=None):
+    """アカウント別プロファイル。graph（AccountGraph）があれば影響度も付ける"""
     by_user = {}
     for t in all_tweets:
         u = t.get("username", "?")
@@ -285,63 +1307,859 @@ def analyze_accounts(all_tweets):
             "account_url": data["account_url"],
         })
 
+    if graph is not None:
+        influence = graph.pagerank()
+        in_degree = graph.in_degree()
+        for p in profiles:
+            key = p["username"].lower()
+            p["influence"] = influence.get(key, 0.0)
+            p["mentioned_by"] = in_degree.get(key, 0)
+
     return sorted(profiles, key=lambda x: x["total_likes"], reverse=True)
 
 
+def analyze_threads(all_tweets, min_size=2):
+    """conversation_id 単位のスレッド集計（min_size 件以上、合計いいね順）"""
+    convs = {}
+    for t in all_tweets:
+        cid = t.get("conversation_id") or t["id"]
+        c = convs.get(cid)
+        if c is None:
+            c = convs[cid] = {
+                "conversation_id": cid, "count": 0, "likes": 0, "bmarks": 0, "retweets": 0,
+                "impressions": 0, "users": set(), "root": None, "top": t,
+            }
+        m = t["metrics"]
+        c["count"] += 1
+        c["likes"] += m["likes"]
+        c["bmarks"] += m.get("bookmarks", 0)
+        c["retweets"] += m.get("retweets", 0)
+        c["impressions"] += m.get("impressions", 0)
+        c["users"].add(t.get("username", "?"))
+        if t["id"] == cid:
+            c["root"] = t
+        if m["likes"] > c["top"]["metrics"]["likes"]:
+            c["top"] = t
+
+    threads = []
+    for c in convs.values():
+        if c["count"] < min_size:
+            continue
+        head = c["root"] or c["top"]
+        c["accounts"] = len(c.pop("users"))
+        c["username"] = head.get("username", "?")
+        c["url"] = (c["root"] or {}).get("tweet_url") or f"https://x.com/i/status/{c['conversation_id']}"
+        threads.append(c)
+    return sorted(threads, key=lambda c: c["likes"], reverse=True)
+
+
 # ============================================================
-# Markdown 生成
+# アカウントグラフ（メンション・引用）
 # ============================================================
 
-def generate_md(name, all_tweets, per_label, labels, queries=None):
-    lines = []
-    now = datetime.now().strftime("%Y-%m-%d %H:%M")
-    total = len(all_tweets)
+class AccountGraph:
+    """誰が誰をメンション/引用したかの有向グラフ。辺は (src, dst, 重み) の疎な配列で持つ。
+    引用先の作者はコーパス内のツイートからのみ解決する"""
+
+    def __init__(self, all_tweets):
+        self.nodes = []        # index → 表示用ユーザー名
+        self._index = {}       # 小文字ユーザー名 → index
+        edges = Counter()
+        author_of = {t["id"]: t.get("username", "?") for t in all_tweets}
+        for t in all_tweets:
+            src = self._node(t.get("username", "?"))
+            targets = set()
+            for m in t.get("mentions", []) or []:
+                if m:
+                    targets.add(self._node(m))
+            for ref in t.get("referenced_tweets", []) or []:
+                if ref.get("type") == "quoted" and ref.get("id") in author_of:
+                    targets.add(self._node(author_of[ref["id"]]))
+            targets.discard(src)
+            for dst in sorted(targets):
+                edges[src, dst] += 1
+        self.src = array("l", (s for s, _ in edges))
+        self.dst = array("l", (d for _, d in edges))
+        self.weight = array("d", edges.values())
+
+    def _node(self, username):
+        key = username.lower()
+        i = self._index.get(key)
+        if i is None:
+            i = self._index[key] = len(self.nodes)
+            self.nodes.append(username)
+        return i
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def edge_count(self):
+        return len(self.src)
+
+    def in_degree(self):
+        """{ユーザー名(小文字): メンション/引用してきたアカウント数}"""
+        deg = Counter()
+        for d in self.dst:
+            deg[d] += 1
+        return {self.nodes[i].lower(): c for i, c in deg.items()}
+
+    def pagerank(self, damping=0.85, tol=1e-9, max_iter=100):
+        """PageRank（べき乗法）。{ユーザー名(小文字): スコア}、スコアの平均が 1.0 になるよう正規化"""
+        n = len(self.nodes)
+        if n == 0:
+            return {}
+        out_weight = [0.0] * n
+        for s, w in zip(self.src, self.weight):
+            out_weight[s] += w
+        # 辺ごとの遷移確率（出次数で正規化）
+        prob = array("d", (w / out_weight[s] for s, w in zip(self.src, self.weight)))
+        dangling = [i for i in range(n) if out_weight[i] == 0]
+        rank = [1.0 / n] * n
+        for _ in range(max_iter):
+            leak = damping * sum(rank[i] for i in dangling) / n
+            base = (1.0 - damping) / n + leak
+            new = [base] * n
+            for s, d, p in zip(self.src, self.dst, prob):
+                new[d] += damping * rank[s] * p
+            delta = sum(abs(a - b) for a, b in zip(new, rank))
+            rank = new
+            if delta < tol:
+                break
+        return {self.nodes[i].lower(): r * n for i, r in enumerate(rank)}
 
-    lines.append(f"# {name}")
-    lines.append(f"")
-    lines.append(f"> 生成日時: {now} | 合計: {total}件 | X直近7日間")
-    lines.append(f"")
 
-    if not all_tweets:
-        lines.append("データなし。")
-        return "\n".join(lines)
+# ============================================================
+# 外部リンク集計
+# ============================================================
 
-    # --- Pre-compute ---
-    likes = [t["metrics"]["likes"] for t in all_tweets]
-    bmarks = [t["metrics"].get("bookmarks", 0) for t in all_tweets]
-    total_likes = sum(likes)
-    avg_likes = total_likes / len(likes)
-    max_t = max(all_tweets, key=lambda t: t["metrics"]["likes"])
-    total_bmarks = sum(bmarks)
-    save_rate = total_bmarks / total_likes if total_likes > 0 else 0
-    type_counts = Counter(t.get("post_type", "text") for t in all_tweets)
-    top10 = sorted(all_tweets, key=lambda t: t["metrics"]["likes"], reverse=True)[:10]
-    eff_sorted = sorted(all_tweets, key=lambda t: t["metrics"]["likes"] / max(t.get("author_followers", 1), 1), reverse=True)
-    save_sorted = sorted(
-        [t for t in all_tweets if t["metrics"]["likes"] >= 50],
-        key=lambda t: t["metrics"].get("bookmarks", 0) / max(t["metrics"]["likes"], 1),
-        reverse=True
+# 集計時に落とすトラッキング系クエリパラメータ
+# （s / t / ref のような汎用名は検索語や再生位置のこともあるので落とさない）
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "ref_src", "ref_url", "si", "spm", "_ga",
+}
+# 特定ホストでだけ落とすパラメータ
+HOST_TRACKING_PARAMS = {
+    "youtube.com": {"feature"},
+    "m.youtube.com": {"feature"},
+    "youtu.be": {"feature"},
+}
+_INTERNAL_HOSTS = ("x.com", "twitter.com", "t.co")
+
+
+def normalize_url(url):
+    """外部URLを集計キーに正規化（https化・www除去・トラッキング除去・クエリ整列・末尾スラッシュ除去）。
+    解釈できない URL（範囲外のポート・閉じていない IPv6 等）はそのまま集計キーにする"""
+    try:
+        parts = urlsplit(url.strip())
+        host = (parts.hostname or "").lower()
+        port = parts.port
+    except ValueError:
+        return url.strip()
+    if host.startswith("www."):
+        host = host[4:]
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    host_params = HOST_TRACKING_PARAMS.get(host, ())
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+        and k.lower() not in host_params
     )
-    topic_map = analyze_topics(all_tweets)
-    account_profiles = analyze_accounts(all_tweets)
-
-    # X記事でテキストがURL-onlyかつタイトル未取得のもの
-    untitled_articles = [
-        t for t in all_tweets
-        if t.get("post_type") == "x_article"
-        and not t.get("_title")
-        and re.match(r'^https?://t\.co/\S+$', t.get("text", "").strip())
+    path = parts.path.rstrip("/")
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+def url_domain(url):
+    """ホスト名（www. 除去）。解釈できない URL は空文字"""
+    try:
+        host = (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def is_internal_url(url):
+    host = url_domain(url)
+    return any(host == h or host.endswith("." + h) for h in _INTERNAL_HOSTS)
+
+
+class LinkStats:
+    """url_meta を正規化URL・ドメイン単位でハッシュ集計する。add() を1ツイートずつ呼ぶ"""
+
+    def __init__(self):
+        # 正規化URL → [投稿数, 合計いいね, タイトル, 代表ツイートのいいね, 代表ユーザー, 元URL]
+        self.urls = {}
+        # ドメイン → [投稿数, 合計いいね, URL数]
+        self.domains = {}
+
+    def __len__(self):
+        return len(self.urls)
+
+    def add(self, t):
+        lk = t["metrics"]["likes"]
+        seen_urls, seen_domains = set(), set()
+        for um in t.get("url_meta", []):
+            eu = um.get("expanded_url", "")
+            if not eu or is_internal_url(eu):
+                continue
+            key = normalize_url(eu)
+            if key in seen_urls:
+                continue
+            seen_urls.add(key)
+            title = um.get("title", "") or ""
+            entry = self.urls.get(key)
+            domain = url_domain(key)
+            if entry is None:
+                self.urls[key] = [1, lk, title, lk, t.get("username", "?"), eu]
+                d = self.domains.setdefault(domain, [0, 0, 0])
+                d[2] += 1
+            else:
+                entry[0] += 1
+                entry[1] += lk
+                if title and not entry[2]:
+                    entry[2] = title
+                if lk > entry[3]:
+                    entry[3], entry[4], entry[5] = lk, t.get("username", "?"), eu
+            if domain not in seen_domains:
+                seen_domains.add(domain)
+                d = self.domains[domain]
+                d[0] += 1
+                d[1] += lk
+
+    def top_urls(self, k=10):
+        """合計いいね上位 k 件: [{url, title, domain, count, likes, top_user, top_likes}]"""
+        top = heapq.nlargest(k, self.urls.items(), key=lambda x: (x[1][1], x[1][0]))
+        return [
+            {"url": e[5], "canonical": key, "title": e[2], "domain": url_domain(key), "count": e[0],
+             "likes": e[1], "top_user": e[4], "top_likes": e[3]}
+            for key, e in top
+        ]
+
+    def top_domains(self, k=10):
+        """合計いいね上位 k ドメイン: [{domain, count, urls, likes}]"""
+        top = heapq.nlargest(k, self.domains.items(), key=lambda x: (x[1][1], x[1][0]))
+        return [{"domain": d, "count": e[0], "likes": e[1], "urls": e[2]} for d, e in top]
+
+
+def aggregate_links(all_tweets):
+    stats = LinkStats()
+    for t in all_tweets:
+        stats.add(t)
+    return stats
+
+
+# ============================================================
+# クロス集計キューブ
+# ============================================================
+
+UNKNOWN_TOPIC = "（話題不明）"
+BUZZ_TAGS = ["X記事", "ビジュアル", "短文一撃", "ハウツー/まとめ", "収益系", "体験談/リアル",
+             "速報/リリース", "スレッド", "問いかけ", "高保存率", "—"]
+FOLLOWER_BUCKETS = [(1_000_000, "1M〜"), (100_000, "100K〜1M"), (10_000, "10K〜100K"),
+                    (1_000, "1K〜10K"), (0, "〜1K")]
+
+CROSS_DIMS = {
+    "topic": "トピック", "post_type": "投稿タイプ", "label": "ラベル",
+    "tag": "バズ要因", "followers": "フォロワー帯",
+}
+CROSS_MEASURES = {"count": "件数", "likes": "合計いいね", "bmarks": "合計ブクマ", "save_rate": "保存率"}
+
+
+def follower_bucket(followers):
+    for floor, name in FOLLOWER_BUCKETS:
+        if followers >= floor:
+            return name
+    return FOLLOWER_BUCKETS[-1][1]
+
+
+class CrossCube:
+    """トピック × 投稿タイプ × ラベル × バズ要因 × フォロワー帯 の集計。
+    ツイートを1回だけ走査してカテゴリコードに落とし、2次元スライスは
+    コード列から int64 の密配列に集計する（セルごとの dict は作らない）"""
+
+    def __init__(self, all_tweets, labels=()):
+        self.categories = {
+            "topic": get_rules().topic_names() + [UNKNOWN_TOPIC],
+            "post_type": sorted(POST_TYPE_LABELS),
+            "label": list(labels),
+            "tag": list(BUZZ_TAGS),
+            "followers": [name for _, name in reversed(FOLLOWER_BUCKETS)],
+        }
+        self._index = {d: {c: i for i, c in enumerate(cats)} for d, cats in self.categories.items()}
+        self._codes = {d: [] for d in CROSS_DIMS}
+        self.likes = array("q")
+        self.bmarks = array("q")
+        self._slices = {}
+
+        for t in all_tweets:
+            m = t["metrics"]
+            self.likes.append(m["likes"])
+            self.bmarks.append(m.get("bookmarks", 0))
+            self._add("topic", detect_topics(t) or [UNKNOWN_TOPIC])
+            self._add("post_type", [t.get("post_type", "text")])
+            self._add("label", [t.get("_label", "")])
+            self._add("tag", tag_buzz_reason(t))
+            self._add("followers", [follower_bucket(t.get("author_followers", 0) or 0)])
+
+    def _add(self, dim, values):
+        index = self._index[dim]
+        codes = []
+        for v in values:
+            code = index.get(v)
+            if code is None:
+                code = index[v] = len(self.categories[dim])
+                self.categories[dim].append(v)
+            codes.append(code)
+        self._codes[dim].append(tuple(codes))
+
+    def __len__(self):
+        return len(self.likes)
+
+    def display_name(self, dim, category):
+        if dim == "post_type":
+            return POST_TYPE_LABELS.get(category, category)
+        return category
+
+    def slice(self, row, col):
+        """row × col の2次元スライス（同じ組み合わせはキャッシュ）"""
+        key = (row, col)
+        if key not in self._slices:
+            self._slices[key] = CrossSlice(self, row, col)
+        return self._slices[key]
+
+
+class CrossSlice:
+    """CrossCube の2次元スライス。セル値は行優先の密配列"""
+
+    def __init__(self, cube, row, col):
+        if row not in CROSS_DIMS or col not in CROSS_DIMS:
+            raise ValueError(f"unknown dimension: {row} x {col}")
+        self.cube, self.row, self.col = cube, row, col
+        nr, nc = len(cube.categories[row]), len(cube.categories[col])
+        self.shape = (nr, nc)
+        self.cells = {m: array("q", bytes(8 * nr * nc)) for m in ("count", "likes", "bmarks")}
+        # 行合計はセルの和ではなく行カテゴリ単位で数える（列が多値でも二重計上しない）
+        self.totals = {m: array("q", bytes(8 * nr)) for m in ("count", "likes", "bmarks")}
+        count, likes, bmarks = self.cells["count"], self.cells["likes"], self.cells["bmarks"]
+        r_count, r_likes, r_bmarks = self.totals["count"], self.totals["likes"], self.totals["bmarks"]
+        for rcodes, ccodes, lk, bm in zip(cube._codes[row], cube._codes[col], cube.likes, cube.bmarks):
+            for r in rcodes:
+                r_count[r] += 1
+                r_likes[r] += lk
+                r_bmarks[r] += bm
+                base = r * nc
+                for c in ccodes:
+                    count[base + c] += 1
+                    likes[base + c] += lk
+                    bmarks[base + c] += bm
+        # 表示順: 行は合計いいね順、列はカテゴリ順（どちらも件数0は除く）
+        self.row_order = sorted((r for r in range(nr) if r_count[r]), key=lambda r: -r_likes[r])
+        self.col_order = [c for c in range(nc) if any(count[r * nc + c] for r in range(nr))]
+
+    def value(self, measure, r, c):
+        j = r * self.shape[1] + c
+        if measure == "save_rate":
+            return self.cells["bmarks"][j] / max(self.cells["likes"][j], 1)
+        return self.cells[measure][j]
+
+    def total(self, measure, r):
+        if measure == "save_rate":
+            return self.totals["bmarks"][r] / max(self.totals["likes"][r], 1)
+        return self.totals[measure][r]
+
+    def header(self):
+        cats = self.cube.categories[self.col]
+        return ([CROSS_DIMS[self.row]]
+                + [self.cube.display_name(self.col, cats[c]) for c in self.col_order] + ["合計"])
+
+    def rows(self, measure):
+        """[行名, セル値..., 合計] のリスト"""
+        cats = self.cube.categories[self.row]
+        return [
+            [self.cube.display_name(self.row, cats[r])]
+            + [self.value(measure, r, c) for c in self.col_order]
+            + [self.total(measure, r)]
+            for r in self.row_order
+        ]
+
+    def to_markdown(self, measure):
+        header = self.header()
+        lines = [
+            "| " + " | ".join(header) + " |",
+            "|" + "|".join("------" for _ in header) + "|",
+        ]
+        for row in self.rows(measure):
+            if measure == "save_rate":
+                cells = [f"{v:.1%}" for v in row[1:]]
+            elif measure == "count":
+                cells = [str(v) for v in row[1:]]
+            else:
+                cells = [compact(v) for v in row[1:]]
+            lines.append("| " + " | ".join([row[0]] + cells) + " |")
+        return lines
+
+
+def parse_cross_spec(spec):
+    """'topic:label' → ('topic', 'label')"""
+    row, sep, col = spec.partition(":")
+    if not sep or row not in CROSS_DIMS or col not in CROSS_DIMS or row == col:
+        raise argparse.ArgumentTypeError(
+            f"クロス集計の指定は 行:列（{', '.join(CROSS_DIMS)} から異なる2つ）: {spec}")
+    return row, col
+
+
+# ============================================================
+# 話題発見（TOPIC_RULES に当たらない投稿のクラスタリング）
+# ============================================================
+#
+# 文字 n-gram の TF-IDF を疎ベクトル（dict）で作り、ミニバッチ k-means でまとめる。
+# 形態素解析も埋め込みも使わないので、日本語でもネットワークなし・CPU だけで動く。
+
+DISCOVER_DEFAULT_K = 8
+DISCOVER_NGRAMS = (2, 3)
+DISCOVER_MAX_FEATURES = 40   # 1投稿あたりに残す n-gram 数（TF-IDF 上位）
+DISCOVER_MIN_DF = 3          # これ未満の投稿にしか出ない n-gram は捨てる
+DISCOVER_MAX_DF = 0.3        # これを超える割合の投稿に出る n-gram も捨てる
+DISCOVER_BATCH_SIZE = 256
+DISCOVER_ITERATIONS = 60
+DISCOVER_MIN_SIZE = 3        # これ未満の件数のクラスタは出さない
+
+_DISCOVER_STRIP = re.compile(r'https?://\S+|[@#]\w+')
+_DISCOVER_SPLIT = re.compile(r'\W+')
+
+
+def char_ngrams(text, sizes=DISCOVER_NGRAMS):
+    """URL・メンション・ハッシュタグを除いた本文の文字 n-gram 出現数（記号・空白はまたがない）"""
+    grams = Counter()
+    for run in _DISCOVER_SPLIT.split(_DISCOVER_STRIP.sub(" ", text.lower())):
+        for n in sizes:
+            if len(run) >= n:
+                grams.update(run[i:i + n] for i in range(len(run) - n + 1))
+    return grams
+
+
+def tfidf_vectors(texts, max_features=DISCOVER_MAX_FEATURES, min_df=DISCOVER_MIN_DF, max_df=DISCOVER_MAX_DF):
+    """各テキストの L2 正規化済み TF-IDF ベクトル（{n-gram: 重み}）。特徴が残らなければ空 dict"""
+    docs = [char_ngrams(text) for text in texts]
+    df = Counter()
+    for d in docs:
+        df.update(d.keys())
+    n = len(docs)
+    upper = max(min_df, int(n * max_df))
+    idf = {g: math.log((1 + n) / (1 + c)) + 1 for g, c in df.items() if min_df <= c <= upper}
+    vectors = []
+    for d in docs:
+        weights = [(g, (1 + math.log(tf)) * idf[g]) for g, tf in d.items() if g in idf]
+        if len(weights) > max_features:
+            weights = heapq.nlargest(max_features, weights, key=lambda x: x[1])
+        norm = math.sqrt(sum(w * w for _, w in weights))
+        vectors.append({g: w / norm for g, w in weights} if norm else {})
+    return vectors
+
+
+class _Centroid:
+    """疎な重心。実際の値は scale * weights[g]。更新時の全要素スケーリングを scale で遅延する"""
+
+    __slots__ = ("weights", "scale", "sq_norm", "count")
+
+    def __init__(self, vec):
+        self.weights = dict(vec)
+        self.scale = 1.0
+        self.sq_norm = sum(w * w for w in vec.values())  # weights の二乗ノルム（scale を掛ける前）
+        self.count = 1
+
+    def dot(self, vec):
+        get = self.weights.get
+        return self.scale * sum(get(g, 0.0) * w for g, w in vec.items())
+
+    def score(self, vec):
+        """単位ベクトル vec との二乗距離 - 1（小さいほど近い）"""
+        return self.scale * self.scale * self.sq_norm - 2 * self.dot(vec)
+
+    def move_toward(self, vec):
+        # c ← (1 - η) c + η x、η = 1 / この重心に割り当てた件数（Sculley 2010）
+        self.count += 1
+        eta = 1.0 / self.count
+        self.scale *= 1 - eta
+        step = eta / self.scale
+        weights = self.weights
+        for g, w in vec.items():
+            old = weights.get(g, 0.0)
+            new = old + step * w
+            weights[g] = new
+            self.sq_norm += new * new - old * old
+        if self.scale < 1e-9:
+            self.weights = {g: v * self.scale for g, v in weights.items()}
+            self.sq_norm = sum(v * v for v in self.weights.values())
+            self.scale = 1.0
+
+    def top_terms(self, k):
+        return heapq.nlargest(k, self.weights, key=self.weights.get)
+
+
+def _nearest(centroids, vec):
+    return min(range(len(centroids)), key=lambda c: centroids[c].score(vec))
+
+
+def minibatch_kmeans(vectors, k, seed=0, batch_size=DISCOVER_BATCH_SIZE, iterations=DISCOVER_ITERATIONS):
+    """単位ベクトル列をミニバッチ k-means で k 個にまとめ、(重心リスト, 各ベクトルの割り当て) を返す。
+    初期値は k-means++。乱数は seed 固定なので同じ入力なら同じ結果"""
+    rng = random.Random(seed)
+    sample = vectors if len(vectors) <= 2000 else rng.sample(vectors, 2000)
+    centroids = [_Centroid(rng.choice(sample))]
+    dist = [2.0 - 2 * centroids[0].dot(v) for v in sample]
+    while len(centroids) < k:
+        total = sum(dist)
+        if total <= 0:
+            break
+        r = rng.random() * total
+        for i, d in enumerate(dist):
+            r -= d
+            if r <= 0:
+                break
+        centroids.append(_Centroid(sample[i]))
+        dist = [min(d, 2.0 - 2 * centroids[-1].dot(v)) for d, v in zip(dist, sample)]
+    for _ in range(iterations):
+        batch = rng.sample(vectors, min(batch_size, len(vectors)))
+        nearest = [_nearest(centroids, v) for v in batch]
+        for v, c in zip(batch, nearest):
+            centroids[c].move_toward(v)
+    return centroids, [_nearest(centroids, v) for v in vectors]
+
+
+def _cluster_keywords(centroid, k=3, candidates=30):
+    """重心の上位 n-gram を k 個のキーワードにする。
+    含む/含まれる n-gram は長い方に、2文字重なる n-gram はつなげる（ホテル+テル予 → ホテル予）"""
+    picked = []
+    for term in centroid.top_terms(candidates):
+        for i, p in enumerate(picked):
+            if term in p:
+                break
+            if p in term:
+                picked[i] = term
+                break
+            if len(term) >= 3 and p.endswith(term[:-1]):
+                picked[i] = p + term[-1]
+                break
+            if len(term) >= 3 and p.startswith(term[1:]):
+                picked[i] = term[0] + p
+                break
+        else:
+            if len(picked) < k:
+                picked.append(term)
+            continue
+        # つないだ結果ほかのキーワードを含むようになったら、そちらは落とす
+        picked = [p for j, p in enumerate(picked) if not any(j != i and p in q for i, q in enumerate(picked))]
+    return picked
+
+
+def discover_topics(all_tweets, k=DISCOVER_DEFAULT_K, seed=0, examples=3):
+    """TOPIC_RULES のどれにも当たらない投稿をクラスタリングし、合計いいね順のクラスタ一覧を返す。
+    各クラスタ: {keywords, count, likes, examples（中心に近い投稿 examples 件）}"""
+    unmatched = [t for t in all_tweets if not detect_topics(t)]
+    pairs = [(t, v) for t, v in zip(unmatched, tfidf_vectors([topic_text(t) for t in unmatched])) if v]
+    k = min(k, len(pairs) // DISCOVER_MIN_SIZE)
+    if k < 2:
+        return []
+    tweets, vectors = zip(*pairs)
+    centroids, assign = minibatch_kmeans(list(vectors), k, seed=seed)
+    members = defaultdict(list)
+    for i, c in enumerate(assign):
+        members[c].append(i)
+    clusters = []
+    for c, idx in members.items():
+        if len(idx) < DISCOVER_MIN_SIZE:
+            continue
+        closest = heapq.nsmallest(examples, idx, key=lambda i: centroids[c].score(vectors[i]))
+        clusters.append({
+            "keywords": _cluster_keywords(centroids[c]),
+            "count": len(idx),
+            "likes": sum(tweets[i]["metrics"]["likes"] for i in idx),
+            "examples": [tweets[i] for i in closest],
+        })
+    clusters.sort(key=lambda x: x["likes"], reverse=True)
+    return clusters
+
+
+# ============================================================
+# 期間比較（--baseline）
+# ============================================================
+#
+# 前回分（base）と今回分（cur）の ReportData を突き合わせる。話題別・アカウント別の
+# 集計は各 ReportData のものをそのまま使い、ツイートID・アカウント・話題で dict の
+# ハッシュ結合をするだけなので、コストはほぼレポート1本分。
+
+def _change(base, cur):
+    """増減率（base が 0 なら None）"""
+    return (cur - base) / base if base else None
+
+
+class ReportDiff:
+    """2つの ReportData の差分。どれも初回アクセス時にだけ計算する"""
+
+    def __init__(self, base, cur):
+        self.base = base
+        self.cur = cur
+
+    @cached_property
+    def metrics(self):
+        """[(指標名, 前回, 今回)]"""
+        base, cur = self.base, self.cur
+        return [
+            ("投稿数", base.total, cur.total),
+            ("合計いいね", base.total_likes, cur.total_likes),
+            ("平均いいね", base.total_likes / base.total if base.total else 0,
+             cur.total_likes / cur.total if cur.total else 0),
+            ("合計ブクマ", base.total_bmarks, cur.total_bmarks),
+            ("平均保存率", base.save_rate, cur.save_rate),
+        ]
+
+    @cached_property
+    def tweets(self):
+        """ツイートID での結合: 両方にある件数・新規・消えた件数と、いいねが伸びた投稿"""
+        base_by_id = {t["id"]: t for t in self.base.all_tweets}
+        common = [(base_by_id[t["id"]], t) for t in self.cur.all_tweets if t["id"] in base_by_id]
+        growth = heapq.nlargest(10, common, key=lambda p: _likes(p[1]) - _likes(p[0]))
+        return {
+            "common": len(common),
+            "new": self.cur.total - len(common),
+            "gone": self.base.total - len(common),
+            "growth": [(b, c) for b, c in growth if _likes(c) > _likes(b)],
+        }
+
+    @cached_property
+    def accounts(self):
+        """アカウントでの結合: 新規・消えた・伸びたアカウント（いずれも合計いいね順）"""
+        base_by_user = {p["username"].lower(): p for p in self.base.account_profiles}
+        cur_by_user = {p["username"].lower(): p for p in self.cur.account_profiles}
+        by_likes = lambda p: p["total_likes"]
+        new = [p for u, p in cur_by_user.items() if u not in base_by_user]
+        gone = [p for u, p in base_by_user.items() if u not in cur_by_user]
+        rising = [(base_by_user[u], p) for u, p in cur_by_user.items() if u in base_by_user]
+        return {
+            "new": sorted(new, key=by_likes, reverse=True),
+            "gone": sorted(gone, key=by_likes, reverse=True),
+            "rising": sorted(rising, key=lambda x: x[1]["total_likes"] - x[0]["total_likes"], reverse=True),
+        }
+
+    @cached_property
+    def topics(self):
+        """話題での結合: [(話題, 前回件数, 今回件数, 前回いいね, 今回いいね)]（いいねの増分順）"""
+        base = {topic: (count, likes) for topic, count, likes, _ in self.base.topic_stats}
+        cur = {topic: (count, likes) for topic, count, likes, _ in self.cur.topic_stats}
+        rows = []
+        for topic in list(cur) + [tp for tp in base if tp not in cur]:
+            b, c = base.get(topic, (0, 0)), cur.get(topic, (0, 0))
+            rows.append((topic, b[0], c[0], b[1], c[1]))
+        return sorted(rows, key=lambda r: r[4] - r[3], reverse=True)
+
+
+# ============================================================
+# Markdown 生成
+# ============================================================
+
+def _likes(t):
+    return t["metrics"]["likes"]
+
+def _save_rate(t):
+    return t["metrics"].get("bookmarks", 0) / max(t["metrics"]["likes"], 1)
+
+
+class ReportData:
+    """Markdown 各セクションが参照する集計値。どれも初回アクセス時にだけ計算する"""
+
+    def __init__(self, name, all_tweets, per_label, labels=None, queries=None, now=None, cross_specs=(),
+                 discover_k=0, baseline=None):
+        self.name = name
+        self.all_tweets = all_tweets
+        self.per_label = per_label
+        self.labels = labels
+        self.queries = queries
+        self.now = now or datetime.now().strftime("%Y-%m-%d %H:%M")
+        self.cross_specs = list(cross_specs)
+        self.discover_k = discover_k
+        self.baseline = baseline  # 比較対象の ReportData（--baseline）
+
+    @cached_property
+    def total(self):
+        return len(self.all_tweets)
+
+    @cached_property
+    def total_likes(self):
+        return sum(_likes(t) for t in self.all_tweets)
+
+    @cached_property
+    def total_bmarks(self):
+        return sum(t["metrics"].get("bookmarks", 0) for t in self.all_tweets)
+
+    @cached_property
+    def save_rate(self):
+        return self.total_bmarks / self.total_likes if self.total_likes > 0 else 0
+
+    @cached_property
+    def max_tweet(self):
+        return max(self.all_tweets, key=_likes)
+
+    @cached_property
+    def type_counts(self):
+        return Counter(t.get("post_type", "text") for t in self.all_tweets)
+
+    @cached_property
+    def top10(self):
+        return heapq.nlargest(10, self.all_tweets, key=_likes)
+
+    @cached_property
+    def bottom10(self):
+        return heapq.nsmallest(10, self.all_tweets, key=_likes)
+
+    @cached_property
+    def save_top5(self):
+        return heapq.nlargest(5, (t for t in self.all_tweets if _likes(t) >= 50), key=_save_rate)
+
+    @cached_property
+    def topic_stats(self):
+        """[(topic, 件数, 合計いいね, いいね降順のツイート)]（合計いいね順）"""
+        return [
+            (topic, len(tweets), sum(_likes(t) for t in tweets), sorted(tweets, key=_likes, reverse=True))
+            for topic, tweets in analyze_topics(self.all_tweets)
+        ]
+
+    @cached_property
+    def latest_created_at(self):
+        return max((t.get("created_at") or "" for t in self.all_tweets), default="")
+
+    @cached_property
+    def threads(self):
+        return analyze_threads(self.all_tweets)
+
+    @cached_property
+    def account_graph(self):
+        return AccountGraph(self.all_tweets)
+
+    @cached_property
+    def account_profiles(self):
+        return analyze_accounts(self.all_tweets, self.account_graph)
+
+    @cached_property
+    def untitled_count(self):
+        """X記事でテキストがURL-onlyかつタイトル未取得の件数"""
+        return sum(
+            1 for t in self.all_tweets
+            if t.get("post_type") == "x_article"
+            and not t.get("_title")
+            and re.match(r'^https?://t\.co/\S+$', t.get("text", "").strip())
+        )
+
+    @cached_property
+    def label_stats(self):
+        """[(label, {count, likes, bmarks, max_tweet})]（per_label の順）"""
+        stats = []
+        for label, tweets in self.per_label.items():
+            stats.append((label, {
+                "count": len(tweets),
+                "likes": sum(_likes(t) for t in tweets),
+                "bmarks": sum(t["metrics"].get("bookmarks", 0) for t in tweets),
+                "max_tweet": max(tweets, key=_likes) if tweets else None,
+            }))
+        return stats
+
+    @cached_property
+    def cube(self):
+        return CrossCube(self.all_tweets, self.per_label)
+
+    @cached_property
+    def links(self):
+        return aggregate_links(self.all_tweets)
+
+    @cached_property
+    def diff(self):
+        return ReportDiff(self.baseline, self) if self.baseline is not None else None
+
+    @cached_property
+    def discovered(self):
+        return discover_topics(self.all_tweets, self.discover_k) if self.discover_k else []
+
+
+def md_header(data):
+    return [
+        f"# {data.name}",
+        f"",
+        f"> 生成日時: {data.now} | 合計: {data.total}件 | X直近7日間",
+        f"",
     ]
 
-    # === 何が語られているか ===
-    lines.append(f"## 何が語られているか")
+def md_footer(data):
+    return [f"---", f"*Generated by x-research skill*"]
+
+
+def _fmt_delta(base, cur, rate=False):
+    """増減の表示。rate=True は保存率などの比率（ポイント差）"""
+    if rate:
+        return f"{(cur - base) * 100:+.1f}pt"
+    change = _change(base, cur)
+    if change is None:
+        return "新規" if cur else "—"
+    return f"{'+' if cur >= base else '-'}{compact(abs(cur - base))}（{change:+.0%}）"
+
+
+def md_section_diff(data):
+    """前回との比較（--baseline 指定時のみ）"""
+    diff = data.diff
+    if diff is None:
+        return []
+    lines = [f"## 前回との比較（{diff.base.name}）", f""]
+    lines.append(f"| 指標 | 前回 | 今回 | 増減 |")
+    lines.append(f"|------|------|------|------|")
+    for label, b, c in diff.metrics:
+        if label == "平均保存率":
+            lines.append(f"| {label} | {b:.1%} | {c:.1%} | {_fmt_delta(b, c, rate=True)} |")
+        else:
+            lines.append(f"| {label} | {compact(b)} | {compact(c)} | {_fmt_delta(b, c)} |")
+    lines.append(f"")
+
+    tw = diff.tweets
+    lines.append(f"**投稿**: 両方に{tw['common']}件 / 今回のみ{tw['new']}件 / 前回のみ{tw['gone']}件")
     lines.append(f"")
-    if topic_map:
+    if tw["growth"]:
+        lines.append(f"**前回からいいねが伸びた投稿:**")
+        for b, c in tw["growth"][:5]:
+            display = get_display_text(c, max_len=60).replace("\n", " ")
+            lines.append(f"- @{c['username']}: {display} — {compact(_likes(b))} → {compact(_likes(c))}いいね")
+        lines.append(f"")
+
+    lines.append(f"### 話題の増減")
+    lines.append(f"")
+    lines.append(f"| 話題 | 件数（前回→今回） | いいね（前回→今回） | 増減 |")
+    lines.append(f"|------|------------------|--------------------|------|")
+    for topic, bc, cc, bl, cl in diff.topics:
+        lines.append(f"| {topic} | {bc} → {cc} | {compact(bl)} → {compact(cl)} | {_fmt_delta(bl, cl)} |")
+    lines.append(f"")
+
+    acc = diff.accounts
+    lines.append(f"### アカウントの入れ替わり")
+    lines.append(f"")
+    for label, profiles in (("新規", acc["new"]), ("消えた", acc["gone"])):
+        if profiles:
+            names = " / ".join(f"@{p['username']}（{compact(p['total_likes'])}いいね）" for p in profiles[:5])
+            lines.append(f"- **{label}**（{len(profiles)}アカウント）: {names}")
+    rising = [(b, c) for b, c in acc["rising"][:5] if c["total_likes"] > b["total_likes"]]
+    if rising:
+        names = " / ".join(f"@{c['username']}（{compact(b['total_likes'])} → {compact(c['total_likes'])}）" for b, c in rising)
+        lines.append(f"- **伸びた**: {names}")
+    lines.append(f"")
+    return lines
+
+
+def md_section_topics(data):
+    """何が語られているか"""
+    lines = [f"## 何が語られているか", f""]
+    topic_stats = data.topic_stats
+    if topic_stats:
         used_example_ids = set()
-        for topic, tweets in topic_map[:5]:
-            topic_likes = sum(t["metrics"]["likes"] for t in tweets)
+        for topic, count, topic_likes, sorted_tweets in topic_stats[:5]:
             # 既に例として使ったツイートを避けて選ぶ
-            sorted_tweets = sorted(tweets, key=lambda t: t["metrics"]["likes"], reverse=True)
             top_tweet = next((t for t in sorted_tweets if t["id"] not in used_example_ids), None)
             if top_tweet is None:
                 top_tweet = sorted_tweets[0]
@@ -349,27 +2167,48 @@ def generate_md(name, all_tweets, per_label, labels, queries=None):
             else:
                 sample = get_display_text(top_tweet, max_len=80).replace("\n", " ")
             used_example_ids.add(top_tweet["id"])
-            lines.append(f"- **{topic}**（{len(tweets)}件 / {compact(topic_likes)}いいね）— 例: {sample}")
+            lines.append(f"- **{topic}**（{count}件 / {compact(topic_likes)}いいね）— 例: {sample}")
         lines.append(f"")
     else:
         lines.append(f"テキストから話題を検出できませんでした。X記事が多い場合は `--titles` でタイトルを渡してください。")
         lines.append(f"")
 
-    if untitled_articles:
-        lines.append(f"> ⚠ X記事{len(untitled_articles)}件はAPIからタイトル取得不可。`--titles` でタイトルJSONを渡すと内容が反映されます。")
+    if data.untitled_count:
+        lines.append(f"> ⚠ X記事{data.untitled_count}件はAPIからタイトル取得不可。`--titles` でタイトルJSONを渡すと内容が反映されます。")
         lines.append(f"")
-
-    # === キーパーソン ===
-    lines.append(f"## キーパーソン")
+    return lines
+
+
+def md_section_discover(data):
+    """ルール外の話題（--discover 指定時のみ）"""
+    clusters = data.discovered
+    if not clusters:
+        return []
+    unmatched = sum(c["count"] for c in clusters)
+    lines = [f"## ルール外の話題", f"", f"> 話題ルールに当たらなかった投稿のうち{unmatched}件を、文字の並びの近さで自動グループ化", f""]
+    for c in clusters[:5]:
+        lines.append(f"- **{' / '.join(c['keywords'])}**（{c['count']}件 / {compact(c['likes'])}いいね）")
+        for t in c["examples"][:2]:
+            display = get_display_text(t, max_len=60).replace("\n", " ")
+            lines.append(f"  - @{t['username']}: {display} [{compact(t['metrics']['likes'])}いいね]({t.get('tweet_url', '')})")
     lines.append(f"")
-    for p in account_profiles[:8]:
+    return lines
+
+
+def md_section_people(data):
+    """キーパーソン"""
+    lines = [f"## キーパーソン", f""]
+    for p in data.account_profiles[:8]:
         if p["total_likes"] < 10: continue
         if not p["topics"]: continue
         pt_label = POST_TYPE_LABELS.get(p["main_type"], "?")
         topic_str = "、".join(t for t, _ in p["topics"]) if p["topics"] else "話題不明"
         lines.append(f"### @{p['username']}（{compact(p['followers'])}フォロワー / {p['count']}件 / 計{compact(p['total_likes'])}いいね）")
         lines.append(f"")
-        lines.append(f"- **話題**: {topic_str} | **主な形式**: {pt_label}")
+        if "influence" in p:
+            lines.append(f"- **話題**: {topic_str} | **主な形式**: {pt_label} | **影響度**: {p['influence']:.1f}（{p['mentioned_by']}アカウントから言及/引用）")
+        else:
+            lines.append(f"- **話題**: {topic_str} | **主な形式**: {pt_label}")
         if p["samples"]:
             for s in p["samples"][:3]:
                 # 改行を除去して1行に
@@ -378,52 +2217,54 @@ def generate_md(name, all_tweets, per_label, labels, queries=None):
                     s_clean = s_clean[:100] + "…"
                 lines.append(f"- {s_clean}")
         lines.append(f"")
+    return lines
 
-    # === アクションプラン ===
-    lines.append(f"## 次にやるべきこと")
-    lines.append(f"")
+
+def md_section_actions(data):
+    """次にやるべきこと"""
+    lines = [f"## 次にやるべきこと", f""]
 
     # フォーマット戦略
-    top10_types = Counter(t.get("post_type", "text") for t in top10)
+    top10_types = Counter(t.get("post_type", "text") for t in data.top10)
     top10_best = top10_types.most_common(1)[0]
     top10_best_label = POST_TYPE_LABELS.get(top10_best[0], top10_best[0])
     lines.append(f"1. **フォーマット**: TOP10では「{top10_best_label}」が{top10_best[1]}/10件。")
 
     # 話題戦略
-    if topic_map:
-        best_topic = topic_map[0]
-        best_topic_likes = sum(t["metrics"]["likes"] for t in best_topic[1])
-        lines.append(f"2. **狙うべき話題**: 「{best_topic[0]}」が{compact(best_topic_likes)}いいねで最も反応が強い。")
+    if data.topic_stats:
+        best_topic, _, best_topic_likes, _ = data.topic_stats[0]
+        lines.append(f"2. **狙うべき話題**: 「{best_topic}」が{compact(best_topic_likes)}いいねで最も反応が強い。")
 
     # ラベル比較
-    if len(per_label) > 1:
+    if len(data.label_stats) > 1:
         label_stats = {}
-        for label, tweets in per_label.items():
-            if not tweets: continue
-            avg_l = sum(t["metrics"]["likes"] for t in tweets) / len(tweets)
-            label_stats[label] = avg_l
+        for label, st in data.label_stats:
+            if not st["count"]: continue
+            label_stats[label] = st["likes"] / st["count"]
         if label_stats:
             best = max(label_stats.items(), key=lambda x: x[1])
             lines.append(f"3. **切り口**: 「{best[0]}」が平均{compact(best[1])}いいねで最も強い。")
 
     # 保存率
+    save_rate = data.save_rate
     if save_rate >= 0.5:
         lines.append(f"4. **保存率{save_rate:.0%}**: 「後で見返したい」実用コンテンツの需要が高い。ハウツー系で出すのが効果的。")
     elif save_rate >= 0.3:
         lines.append(f"4. **保存率{save_rate:.0%}**: 実用的な情報への需要あり。")
 
     # 避けるべき
-    bottom = sorted(all_tweets, key=lambda t: t["metrics"]["likes"])[:10]
-    bottom_types = Counter(t.get("post_type", "text") for t in bottom)
+    bottom_types = Counter(t.get("post_type", "text") for t in data.bottom10)
     bottom_top = bottom_types.most_common(1)[0]
     bottom_label = POST_TYPE_LABELS.get(bottom_top[0], bottom_top[0])
     lines.append(f"5. **避けるべき**: いいね下位10件は「{bottom_label}」が{bottom_top[1]}/10件。")
     lines.append(f"")
+    return lines
 
-    # === バズTOP10 ===
-    lines.append(f"## バズTOP10")
-    lines.append(f"")
-    for i, t in enumerate(top10, 1):
+
+def md_section_top10(data):
+    """バズTOP10"""
+    lines = [f"## バズTOP10", f""]
+    for i, t in enumerate(data.top10, 1):
         m = t["metrics"]
         tags = tag_buzz_reason(t)
         tag_str = " ".join(f"`{tag}`" for tag in tags)
@@ -443,84 +2284,512 @@ def generate_md(name, all_tweets, per_label, labels, queries=None):
         lines.append(f"")
         lines.append(f"{tag_str} — [{t.get('tweet_url', '')}]({t.get('tweet_url', '')})")
         lines.append(f"")
+    return lines
+
+
+def md_section_threads(data):
+    """スレッドTOP（conversation_id 単位の合計）"""
+    threads = data.threads
+    if not threads:
+        return []
+    lines = [f"## スレッドTOP5", f""]
+    for i, c in enumerate(threads[:5], 1):
+        head = c["root"] or c["top"]
+        display = get_display_text(head, max_len=80).replace("\n", " ")
+        root_note = "" if c["root"] else "（起点は未取得、最大いいねの投稿）"
+        lines.append(f"{i}. **@{c['username']}** — {c['count']}件 / 計{compact(c['likes'])}いいね / {compact(c['bmarks'])}ブクマ / {c['accounts']}アカウント参加")
+        lines.append(f"   {display}{root_note}")
+        lines.append(f"   [{c['url']}]({c['url']})")
+        lines.append(f"")
+    return lines
 
-    # === 数値サマリー ===
-    lines.append(f"## 数値サマリー")
-    lines.append(f"")
+
+def md_section_summary(data):
+    """数値サマリー"""
+    lines = [f"## 数値サマリー", f""]
 
     # 検索クエリ
+    queries = data.queries
     lines.append(f"**検索クエリ:**")
-    for i, (label, tweets) in enumerate(per_label.items()):
+    for i, (label, st) in enumerate(data.label_stats):
         q_str = ""
         if queries and i < len(queries):
             q_str = f" — `{queries[i]}`"
-        lines.append(f"- {label}: {len(tweets)}件{q_str}")
+        lines.append(f"- {label}: {st['count']}件{q_str}")
     lines.append(f"")
 
+    max_t = data.max_tweet
     lines.append(f"| 指標 | 値 |")
     lines.append(f"|------|-----|")
-    lines.append(f"| 投稿数 | {total}件 |")
-    lines.append(f"| 合計いいね | {compact(total_likes)} |")
-    lines.append(f"| 平均いいね | {compact(avg_likes)} |")
+    lines.append(f"| 投稿数 | {data.total}件 |")
+    lines.append(f"| 合計いいね | {compact(data.total_likes)} |")
+    lines.append(f"| 平均いいね | {compact(data.total_likes / data.total)} |")
     lines.append(f"| 最大いいね | {compact(max_t['metrics']['likes'])} (@{max_t['username']}) |")
-    lines.append(f"| 平均保存率 | {save_rate:.1%} |")
+    lines.append(f"| 平均保存率 | {data.save_rate:.1%} |")
     lines.append(f"")
 
+    type_counts = data.type_counts
     if type_counts:
         type_str = " / ".join(f"{POST_TYPE_LABELS.get(pt, pt)}: {c}件" for pt, c in type_counts.most_common())
         lines.append(f"**投稿タイプ**: {type_str}")
         lines.append(f"")
 
-    if len(per_label) > 1:
+    if len(data.label_stats) > 1:
         lines.append(f"### ラベル別比較")
         lines.append(f"")
         lines.append(f"| ラベル | 件数 | 平均いいね | 最大 | 保存率 |")
         lines.append(f"|--------|------|-----------|------|--------|")
-        for label, tweets in per_label.items():
-            if not tweets: continue
-            l = [t["metrics"]["likes"] for t in tweets]
-            b = [t["metrics"].get("bookmarks", 0) for t in tweets]
-            top = max(tweets, key=lambda t: t["metrics"]["likes"])
-            sr = sum(b) / sum(l) if sum(l) > 0 else 0
-            lines.append(f"| {label} | {len(tweets)} | {compact(sum(l)/len(l))} | {compact(max(l))} (@{top['username']}) | {sr:.1%} |")
+        for label, st in data.label_stats:
+            if not st["count"]: continue
+            top = st["max_tweet"]
+            sr = st["bmarks"] / st["likes"] if st["likes"] > 0 else 0
+            lines.append(f"| {label} | {st['count']} | {compact(st['likes']/st['count'])} | {compact(top['metrics']['likes'])} (@{top['username']}) | {sr:.1%} |")
         lines.append(f"")
+    return lines
+
 
-    # === 保存されるコンテンツ ===
-    if save_sorted:
-        lines.append(f"## 保存されるコンテンツ（保存率TOP5）")
+def md_section_save(data):
+    """保存されるコンテンツ（保存率TOP5）"""
+    if not data.save_top5:
+        return []
+    lines = [f"## 保存されるコンテンツ（保存率TOP5）", f""]
+    for i, t in enumerate(data.save_top5, 1):
+        sr = t["metrics"].get("bookmarks", 0) / t["metrics"]["likes"]
+        pt_label = POST_TYPE_LABELS.get(t.get("post_type", "text"), "?")
+        display = get_display_text(t, max_len=100)
+        display_clean = display.replace("\n", " ")
+        lines.append(f"{i}. **@{t['username']}** (保存率{sr:.0%} / {compact(t['metrics']['likes'])}L) — {display_clean}")
+        lines.append(f"   [{t.get('tweet_url', '')}]({t.get('tweet_url', '')})")
+        lines.append(f"")
+    return lines
+
+
+def md_section_links(data):
+    """外部リンク（正規化URL単位 + ドメイン別）"""
+    links = data.links
+    if not links:
+        return []
+    lines = [f"## 外部リンク", f""]
+    for e in links.top_urls(10):
+        label = e["title"] if e["title"] else e["url"]
+        lines.append(f"- [{label}]({e['url']}) — @{e['top_user']}（{compact(e['top_likes'])}いいね）"
+                     + (f"ほか{e['count'] - 1}件 / 計{compact(e['likes'])}いいね" if e["count"] > 1 else ""))
+    lines.append(f"")
+    domains = links.top_domains(5)
+    if domains:
+        dom_str = " / ".join(f"{d['domain']}: {d['count']}件・{compact(d['likes'])}いいね" for d in domains)
+        lines.append(f"**ドメイン別**: {dom_str}")
         lines.append(f"")
-        for i, t in enumerate(save_sorted[:5], 1):
-            sr = t["metrics"].get("bookmarks", 0) / t["metrics"]["likes"]
-            pt_label = POST_TYPE_LABELS.get(t.get("post_type", "text"), "?")
-            display = get_display_text(t, max_len=100)
-            display_clean = display.replace("\n", " ")
-            lines.append(f"{i}. **@{t['username']}** (保存率{sr:.0%} / {compact(t['metrics']['likes'])}L) — {display_clean}")
-            lines.append(f"   [{t.get('tweet_url', '')}]({t.get('tweet_url', '')})")
+    return lines
+
+
+def md_section_cross(data):
+    """クロス集計（--cross で指定したスライスのみ）"""
+    if not data.cross_specs:
+        return []
+    lines = [f"## クロス集計", f""]
+    for row, col in data.cross_specs:
+        sl = data.cube.slice(row, col)
+        for measure in ("count", "likes", "save_rate"):
+            lines.append(f"**{CROSS_DIMS[row]} × {CROSS_DIMS[col]}（{CROSS_MEASURES[measure]}）**")
             lines.append(f"")
+            lines.extend(sl.to_markdown(measure))
+            lines.append(f"")
+    return lines
+
+
+# セクション名 → 生成関数（この順でレポートに並ぶ）
+MD_SECTIONS = {
+    "diff": md_section_diff,
+    "topics": md_section_topics,
+    "discover": md_section_discover,
+    "people": md_section_people,
+    "actions": md_section_actions,
+    "top10": md_section_top10,
+    "threads": md_section_threads,
+    "summary": md_section_summary,
+    "save": md_section_save,
+    "links": md_section_links,
+    "cross": md_section_cross,
+}
 
-    # === 外部リンク ===
-    ext_urls = []
-    for t in all_tweets:
+
+def render_section(key, data):
+    """1セクションだけを Markdown 文字列で返す（Python から個別に使う用）"""
+    return "\n".join(MD_SECTIONS[key](data))
+
+
+def iter_md_sections(data, sections=None):
+    """ヘッダ → 各セクション → フッタの順に、出来たものから行リストを返す"""
+    yield md_header(data)
+    if not data.total:
+        yield ["データなし。"]
+        return
+    for key, render in MD_SECTIONS.items():
+        if sections is None or key in sections:
+            lines = render(data)
+            if lines:
+                yield lines
+    yield md_footer(data)
+
+
+@with_rules_snapshot
+def write_md(data, out=None, echo=None, sections=None):
+    """Markdown をセクション単位で out（ファイル）と echo（stdout 等）に逐次書き出す。
+    レポート全体の文字列は作らない"""
+    streams = [s for s in (out, echo) if s is not None]
+    for i, lines in enumerate(iter_md_sections(data, sections)):
+        chunk = ("\n" if i else "") + "\n".join(lines)
+        for stream in streams:
+            stream.write(chunk)
+            stream.flush()
+
+
+def generate_md(name, all_tweets, per_label, labels, queries=None, sections=None, cross_specs=(), discover_k=0):
+    """レポート全体を1つの Markdown 文字列で返す。sections: 出力するセクション名（None なら全部）"""
+    buf = io.StringIO()
+    data = ReportData(name, all_tweets, per_label, labels, queries, cross_specs=cross_specs, discover_k=discover_k)
+    write_md(data, out=buf, sections=sections)
+    return buf.getvalue()
+
+
+# ============================================================
+# ストリーミング集計（--stream）
+# ============================================================
+#
+# 数百万件規模でも all_tweets を持たずにレポートを出すためのモード。
+# ランキングは固定長ヒープ、アカウント別合計は Space-Saving、ID重複除去は
+# 任意で Bloom フィルタ。メモリはコーパスサイズではなく K に比例する。
+
+class TopK:
+    """上位（largest=False なら下位）k 件を保持するヒープ。
+    同値は先に来たものを優先するので heapq.nlargest / nsmallest と同じ結果になる"""
+
+    def __init__(self, k, key, largest=True):
+        self.k = k
+        self.key = key
+        self.largest = largest
+        self._heap = []
+        self._seq = 0
+
+    def push(self, item):
+        self._seq += 1
+        key = self.key(item)
+        # ヒープの根が「次に追い出す要素」になるよう符号を揃える
+        entry = ((key if self.largest else -key), -self._seq, item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def items(self):
+        return [e[2] for e in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+
+
+class SpaceSaving:
+    """重み付き Space-Saving。capacity 個のカウンタで重みの大きいキーを追跡する。
+    追い出されたキーの重みは、新しく入ったキーの誤差（error）として引き継ぐ"""
+
+    def __init__(self, capacity, factory=dict):
+        self.capacity = capacity
+        self.factory = factory
+        self.entries = {}   # key → [weight, error, payload]
+        self._heap = []     # (weight, key) 遅延削除つき min-heap
+
+    def add(self, key, weight):
+        """key に weight を加算して payload を返す"""
+        entry = self.entries.get(key)
+        if entry is None:
+            error = self._evict() if len(self.entries) >= self.capacity else 0
+            entry = self.entries[key] = [error, error, self.factory()]
+        entry[0] += weight
+        heapq.heappush(self._heap, (entry[0], key))
+        if len(self._heap) > 4 * self.capacity + 64:
+            self._heap = [(e[0], k) for k, e in self.entries.items()]
+            heapq.heapify(self._heap)
+        return entry[2]
+
+    def _evict(self):
+        while True:
+            weight, key = heapq.heappop(self._heap)
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == weight:
+                del self.entries[key]
+                return weight
+
+    def top(self, k=None):
+        """[(key, weight, error, payload)] を重み降順で"""
+        ranked = sorted(self.entries.items(), key=lambda x: x[1][0], reverse=True)
+        return [(key, e[0], e[1], e[2]) for key, e in ranked[:k]]
+
+
+class BloomFilter:
+    """ID重複除去用の Bloom フィルタ。set と同じ add / in で使える（偽陽性率 fp_rate）"""
+
+    def __init__(self, capacity, fp_rate=0.001):
+        capacity = max(int(capacity), 1)
+        self.size = max(int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+def _link_payload():
+    return {"count": 0, "title": "", "top_likes": -1, "top_user": "?", "url": ""}
+
+
+def _domain_payload():
+    return {"count": 0, "urls": 0}
+
+
+class StreamLinkStats:
+    """LinkStats の上限つき版。正規化URL・ドメインそれぞれ capacity 個の
+    Space-Saving カウンタで合計いいねを追う。top_urls / top_domains は LinkStats と同じ形で、
+    追い出しが起きると値は推定（上振れ）になる"""
+
+    def __init__(self, capacity=1000):
+        self.urls = SpaceSaving(capacity, _link_payload)
+        self.domains = SpaceSaving(capacity, _domain_payload)
+
+    def __len__(self):
+        return len(self.urls.entries)
+
+    def add(self, t):
+        lk = t["metrics"]["likes"]
+        seen_urls, seen_domains = set(), set()
         for um in t.get("url_meta", []):
             eu = um.get("expanded_url", "")
-            title = um.get("title", "")
-            if eu and "x.com" not in eu and "twitter.com" not in eu:
-                ext_urls.append((eu, title, t["metrics"]["likes"], t["username"]))
-    if ext_urls:
-        ext_urls.sort(key=lambda x: x[2], reverse=True)
-        seen_urls = set()
-        lines.append(f"## 外部リンク")
-        lines.append(f"")
-        for url, title, lk, user in ext_urls[:10]:
-            if url in seen_urls: continue
-            seen_urls.add(url)
-            label = title if title else url
-            lines.append(f"- [{label}]({url}) — @{user}（{compact(lk)}いいね）")
-        lines.append(f"")
+            if not eu or is_internal_url(eu):
+                continue
+            key = normalize_url(eu)
+            if key in seen_urls:
+                continue
+            seen_urls.add(key)
+            domain = url_domain(key)
+            p = self.urls.add(key, lk)
+            if p["count"] == 0:
+                # 新規（または追い出し後の再登録）URL。ドメインの URL 数も推定値になる
+                self.domains.add(domain, 0)["urls"] += 1
+            p["count"] += 1
+            title = um.get("title", "") or ""
+            if title and not p["title"]:
+                p["title"] = title
+            if lk > p["top_likes"]:
+                p["top_likes"], p["top_user"], p["url"] = lk, t.get("username", "?"), eu
+            if domain not in seen_domains:
+                seen_domains.add(domain)
+                self.domains.add(domain, lk)["count"] += 1
+
+    def top_urls(self, k=10):
+        """合計いいね上位 k 件（推定）: LinkStats.top_urls と同じキー + error"""
+        top = heapq.nlargest(k, self.urls.entries.items(), key=lambda x: (x[1][0], x[1][2]["count"]))
+        return [
+            {"url": p["url"], "canonical": key, "title": p["title"], "domain": url_domain(key),
+             "count": p["count"], "likes": w, "top_user": p["top_user"], "top_likes": p["top_likes"],
+             "error": err}
+            for key, (w, err, p) in top
+        ]
+
+    def top_domains(self, k=10):
+        """合計いいね上位 k ドメイン（推定）: [{domain, count, urls, likes, error}]"""
+        top = heapq.nlargest(k, self.domains.entries.items(), key=lambda x: (x[1][0], x[1][2]["count"]))
+        return [{"domain": d, "count": p["count"], "likes": w, "urls": p["urls"], "error": err}
+                for d, (w, err, p) in top]
+
+
+def _profile_payload():
+    return {"followers": None, "account_url": "", "count": 0, "total_bmarks": 0,
+            "types": Counter(), "topics": Counter(), "samples": TopK(3, _likes)}
+
+
+class StreamReportData:
+    """ReportData のストリーミング版。add() で1件ずつ受け取り、K件ヒープと
+    スケッチだけを保持する。Markdown セクションからは ReportData と同じに見える"""
+
+    def __init__(self, name, labels, queries=None, now=None, account_capacity=1000, link_capacity=1000):
+        self.name = name
+        self.queries = queries
+        self.now = now or datetime.now().strftime("%Y-%m-%d %H:%M")
+        self.cross_specs = []
+        self.threads = []  # スレッド集計は会話数に比例するので --stream では行わない
+        self.discovered = []  # 話題発見は全投稿の本文が要るので --stream では行わない
+        self.diff = None  # --baseline は全件の突き合わせが要るので --stream では行わない
+        self.total = 0
+        self.latest_created_at = ""
+        self.total_likes = 0
+        self.total_bmarks = 0
+        self.type_counts = Counter()
+        self.untitled_count = 0
+        self.links = StreamLinkStats(link_capacity)
+        self._top10 = TopK(10, _likes)
+        self._bottom10 = TopK(10, _likes, largest=False)
+        self._save_top5 = TopK(5, _save_rate)
+        self._eff_top15 = TopK(15, lambda t: t["metrics"]["likes"] / t["author_followers"])
+        self._topics = {}   # topic → [件数, 合計いいね, TopK]
+        self._labels = {label: {"count": 0, "likes": 0, "bmarks": 0, "max_tweet": None} for label in labels}
+        self.accounts = SpaceSaving(account_capacity, _profile_payload)
+
+    def add(self, t):
+        m = t["metrics"]
+        lk = m["likes"]
+        bm = m.get("bookmarks", 0)
+        pt = t.get("post_type", "text")
+        self.total += 1
+        self.latest_created_at = max(self.latest_created_at, t.get("created_at") or "")
+        self.total_likes += lk
+        self.total_bmarks += bm
+        self.type_counts[pt] += 1
+        self._top10.push(t)
+        self._bottom10.push(t)
+        if lk >= 50:
+            self._save_top5.push(t)
+        if (t.get("author_followers", 0) or 0) >= 1:
+            self._eff_top15.push(t)
 
-    lines.append(f"---")
-    lines.append(f"*Generated by x-research skill*")
-    return "\n".join(lines)
+        topics = detect_topics(t)
+        for topic in topics:
+            st = self._topics.get(topic)
+            if st is None:
+                st = self._topics[topic] = [0, 0, TopK(5, _likes)]
+            st[0] += 1
+            st[1] += lk
+            st[2].push(t)
+
+        text = t.get("text", "").strip()
+        url_only = re.match(r'^https?://t\.co/\S+$', text)
+        if pt == "x_article" and not t.get("_title") and url_only:
+            self.untitled_count += 1
+
+        ls = self._labels.setdefault(t.get("_label", ""), {"count": 0, "likes": 0, "bmarks": 0, "max_tweet": None})
+        ls["count"] += 1
+        ls["likes"] += lk
+        ls["bmarks"] += bm
+        if ls["max_tweet"] is None or lk > ls["max_tweet"]["metrics"]["likes"]:
+            ls["max_tweet"] = t
+
+        p = self.accounts.add(t.get("username", "?"), lk)
+        if p["followers"] is None:
+            p["followers"] = t.get("author_followers", 0)
+            p["account_url"] = t.get("account_url", "")
+        p["count"] += 1
+        p["total_bmarks"] += bm
+        p["types"][pt] += 1
+        for topic in topics:
+            p["topics"][topic] += 1
+        title = t.get("_title", "")
+        if title or (not url_only and len(text) > 20):
+            p["samples"].push(t)
+
+        self.links.add(t)
+
+    @property
+    def all_tweets(self):
+        raise AttributeError("StreamReportData はツイート全件を保持しない")
+
+    @property
+    def save_rate(self):
+        return self.total_bmarks / self.total_likes if self.total_likes > 0 else 0
+
+    @property
+    def top10(self):
+        return self._top10.items()
+
+    @property
+    def bottom10(self):
+        return self._bottom10.items()
+
+    @property
+    def save_top5(self):
+        return self._save_top5.items()
+
+    @property
+    def efficiency_top15(self):
+        return [(t, t["metrics"]["likes"] / t["author_followers"]) for t in self._eff_top15.items()]
+
+    @property
+    def max_tweet(self):
+        return self.top10[0]
+
+    @property
+    def topic_stats(self):
+        stats = [(topic, st[0], st[1], st[2].items()) for topic, st in self._topics.items()]
+        return sorted(stats, key=lambda x: x[2], reverse=True)
+
+    @property
+    def label_stats(self):
+        return list(self._labels.items())
+
+    @property
+    def account_profiles(self):
+        """Space-Saving で追跡しているアカウント（合計いいねは推定値、error が上振れ幅）"""
+        profiles = []
+        for username, likes, error, p in self.accounts.top():
+            samples = []
+            for t in p["samples"].items():
+                title = t.get("_title", "")
+                samples.append(f"「{title}」" if title else t.get("text", "").strip()[:80])
+            profiles.append({
+                "username": username,
+                "followers": p["followers"] or 0,
+                "count": p["count"],
+                "total_likes": likes,
+                "likes_error": error,
+                "total_bmarks": p["total_bmarks"],
+                "main_type": p["types"].most_common(1)[0][0],
+                "topics": p["topics"].most_common(3),
+                "samples": samples,
+                "account_url": p["account_url"],
+            })
+        return profiles
+
+
+def write_stream_account_sheet(wb, data):
+    """--stream 用のアカウント別シート（Space-Saving の推定値）"""
+    ws = wb.create_sheet("アカウント別（推定）")
+    headers = [
+        "ユーザー名", "フォロワー", "投稿数", "合計いいね（推定）", "誤差上限",
+        "合計ブクマ", "主な投稿タイプ", "話題", "アカウントURL",
+    ]
+    ws.append(headers)
+    style_header(ws, 1, len(headers))
+    for p in data.account_profiles:
+        ws.append([
+            f"@{p['username']}", p["followers"], p["count"], p["total_likes"], p["likes_error"],
+            p["total_bmarks"], POST_TYPE_LABELS.get(p["main_type"], "?"),
+            ", ".join(t for t, _ in p["topics"]) or "—", p["account_url"],
+        ])
+    for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
+        for i in (1, 3, 4, 5):
+            row[i].number_format = NUM_FMT
+    auto_width(ws)
+    ws.freeze_panes = "A2"
+
+
+@with_rules_snapshot
+def generate_stream_xlsx(xlsx_path, data):
+    """--stream 用 xlsx（ランキング系シートのみ）"""
+    wb = Workbook()
+    wb.remove(wb.active)
+    write_buzz_efficiency_sheet(wb, None, scored=data.efficiency_top15)
+    write_stream_account_sheet(wb, data)
+    if data.links:
+        write_link_sheet(wb, data.links)
+    wb.save(str(xlsx_path))
 
 
 # ============================================================
@@ -597,25 +2866,32 @@ def write_all_tweets_sheet(ws, all_tweets):
     ws.column_dimensions["G"].width = 60
 
 
-def write_account_sheet(wb, all_tweets):
+def write_account_sheet(wb, all_tweets, profiles=None):
+    """アカウント別。profiles: 計算済みの analyze_accounts() の結果（ReportData から渡す）"""
     ws = wb.create_sheet("アカウント別")
     headers = [
         "ユーザー名", "フォロワー", "投稿数", "合計いいね", "平均いいね",
-        "合計ブクマ", "平均保存率", "主な投稿タイプ", "話題", "最大バズ", "アカウントURL",
+        "合計ブクマ", "平均保存率", "主な投稿タイプ", "話題", "最大バズ",
+        "影響度", "被言及アカウント数", "アカウントURL",
     ]
     ws.append(headers)
     style_header(ws, 1, len(headers))
 
-    profiles = analyze_accounts(all_tweets)
+    if profiles is None:
+        profiles = analyze_accounts(all_tweets, AccountGraph(all_tweets))
+    user_max = {}
+    for t in all_tweets:
+        u = t.get("username", "?")
+        user_max[u] = max(user_max.get(u, 0), t["metrics"]["likes"])
     for p in profiles:
         pt_label = POST_TYPE_LABELS.get(p["main_type"], "?")
         topic_str = ", ".join(t for t, _ in p["topics"]) or "—"
         avg_sr = p["total_bmarks"] / max(p["total_likes"], 1)
-        max_likes = max(t["metrics"]["likes"] for t in [tw for tw in all_tweets if tw.get("username") == p["username"]])
+        max_likes = user_max[p["username"]]
         ws.append([
             f"@{p['username']}", p["followers"], p["count"], p["total_likes"],
             p["total_likes"] / p["count"], p["total_bmarks"], avg_sr, pt_label,
-            topic_str, max_likes, p["account_url"],
+            topic_str, max_likes, p["influence"], p["mentioned_by"], p["account_url"],
         ])
 
     for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
@@ -625,6 +2901,7 @@ def write_account_sheet(wb, all_tweets):
         row[5].number_format = NUM_FMT
         row[6].number_format = PCT_FMT
         row[9].number_format = NUM_FMT
+        row[10].number_format = '0.00'
 
     auto_width(ws)
     ws.freeze_panes = "A2"
@@ -830,8 +3107,16 @@ def write_insights_sheet(wb, all_tweets, per_label):
     ws.column_dimensions["D"].width = 20
 
 
-def write_buzz_efficiency_sheet(wb, all_tweets):
-    """バズ効率TOP15 — フォロワー比で最も効率よくバズった投稿"""
+def efficiency_top(all_tweets, k):
+    """フォロワー比いいね上位 k 件: [(tweet, バズ効率)]"""
+    scored = ((t, t["metrics"]["likes"] / t["author_followers"])
+              for t in all_tweets if (t.get("author_followers", 0) or 0) >= 1)
+    return heapq.nlargest(k, scored, key=lambda x: x[1])
+
+
+def write_buzz_efficiency_sheet(wb, all_tweets, scored=None):
+    """バズ効率TOP15 — フォロワー比で最も効率よくバズった投稿。
+    scored: 計算済みの [(tweet, バズ効率)]（--stream 時）"""
     ws = wb.create_sheet("バズ効率TOP15")
     headers = [
         "No", "ユーザー名", "フォロワー", "いいね", "ブクマ", "バズ効率",
@@ -840,16 +3125,10 @@ def write_buzz_efficiency_sheet(wb, all_tweets):
     ws.append(headers)
     style_header(ws, 1, len(headers))
 
-    scored = []
-    for t in all_tweets:
-        followers = t.get("author_followers", 0) or 0
-        if followers < 1:
-            continue
-        eff = t["metrics"]["likes"] / followers
-        scored.append((t, eff))
-    scored.sort(key=lambda x: x[1], reverse=True)
+    if scored is None:
+        scored = efficiency_top(all_tweets, 15)
 
-    for i, (t, eff) in enumerate(scored[:15], 1):
+    for i, (t, eff) in enumerate(scored, 1):
         m = t["metrics"]
         sr = m.get("bookmarks", 0) / max(m["likes"], 1)
         pt = POST_TYPE_LABELS.get(t.get("post_type", "text"), "?")
@@ -881,88 +3160,306 @@ def write_buzz_efficiency_sheet(wb, all_tweets):
     ws.freeze_panes = "A2"
 
 
-def write_cross_tab_sheet(wb, all_tweets):
+def write_thread_sheet(wb, threads):
+    """スレッド別 — conversation_id 単位の合計（2件以上のスレッド）"""
+    ws = wb.create_sheet("スレッド別")
+    headers = [
+        "No", "起点ユーザー", "投稿数", "参加アカウント数", "合計いいね", "合計ブクマ",
+        "合計RT", "合計インプ", "最大いいね", "起点テキスト", "スレッドURL",
+    ]
+    ws.append(headers)
+    style_header(ws, 1, len(headers))
+    for i, c in enumerate(threads, 1):
+        head = c["root"] or c["top"]
+        ws.append([
+            i, f"@{c['username']}", c["count"], c["accounts"], c["likes"], c["bmarks"],
+            c["retweets"], c["impressions"], c["top"]["metrics"]["likes"],
+            get_display_text(head, 80), c["url"],
+        ])
+    for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
+        for col_idx in (4, 5, 6, 7, 8):
+            row[col_idx].number_format = NUM_FMT
+    auto_width(ws)
+    ws.column_dimensions["J"].width = 60
+    ws.freeze_panes = "A2"
+
+
+def write_discover_sheet(wb, clusters):
+    """ルール外の話題 — --discover のクラスタごとの件数と代表投稿"""
+    ws = wb.create_sheet("ルール外の話題")
+    headers = ["No", "キーワード", "件数", "合計いいね", "代表投稿", "いいね", "URL"]
+    ws.append(headers)
+    style_header(ws, 1, len(headers))
+    for i, c in enumerate(clusters, 1):
+        for j, t in enumerate(c["examples"]):
+            head = [i, " / ".join(c["keywords"]), c["count"], c["likes"]] if j == 0 else ["", "", "", ""]
+            ws.append(head + [get_display_text(t, 80), t["metrics"]["likes"], t.get("tweet_url", "")])
+    for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
+        for col_idx in (3, 5):
+            row[col_idx].number_format = NUM_FMT
+    auto_width(ws)
+    ws.column_dimensions["E"].width = 60
+    ws.freeze_panes = "A2"
+
+
+def write_cross_block(ws, sl, measure, lead=None):
+    """スライス1つ分の表（見出し + ヘッダ + 行）を追記"""
+    ws.append(lead if lead is not None else [])
+    ws.append([f"【{CROSS_MEASURES[measure]}】"])
+    ws.cell(ws.max_row, 1).font = Font(bold=True, size=12)
+    headers = sl.header()
+    ws.append(headers)
+    style_header(ws, ws.max_row, len(headers))
+    for row in sl.rows(measure):
+        ws.append(row)
+        if measure == "save_rate":
+            for cell in ws[ws.max_row][1:]:
+                cell.number_format = PCT_FMT
+        elif measure != "count":
+            for cell in ws[ws.max_row][1:]:
+                cell.number_format = NUM_FMT
+
+
+def write_cross_tab_sheet(wb, all_tweets, cube=None):
     """トピック × 投稿タイプ クロス集計"""
     ws = wb.create_sheet("クロス集計")
+    sl = (cube or CrossCube(all_tweets)).slice("topic", "post_type")
+    write_cross_block(ws, sl, "count", lead=[""])
+    write_cross_block(ws, sl, "likes")
+    auto_width(ws)
+    ws.column_dimensions["A"].width = 20
 
-    # 集計
-    cross = defaultdict(lambda: defaultdict(lambda: {"count": 0, "likes": 0}))
-    all_types = set()
-    all_topics = set()
-    for t in all_tweets:
-        pt = t.get("post_type", "text")
-        all_types.add(pt)
-        topics = detect_topics(t)
-        if not topics:
-            topics = ["（話題不明）"]
-        for tp in topics:
-            all_topics.add(tp)
-            cross[tp][pt]["count"] += 1
-            cross[tp][pt]["likes"] += t["metrics"]["likes"]
-
-    type_list = sorted(all_types)
-    topic_list = sorted(all_topics, key=lambda tp: sum(cross[tp][pt]["likes"] for pt in type_list), reverse=True)
-
-    # 件数マトリクス
-    ws.append([""])
-    ws.append(["【件数】"])
+
+def write_cross_slice_sheet(wb, cube, row, col):
+    """--cross で指定したスライス（件数・いいね・ブクマ・保存率）"""
+    ws = wb.create_sheet(f"クロス_{CROSS_DIMS[row]}×{CROSS_DIMS[col]}"[:31])
+    sl = cube.slice(row, col)
+    for i, measure in enumerate(CROSS_MEASURES):
+        write_cross_block(ws, sl, measure, lead=[""] if i == 0 else None)
+    auto_width(ws)
+    ws.column_dimensions["A"].width = 20
+
+
+LINK_SHEET_TOP_K = 100
+
+def write_link_sheet(wb, links):
+    """外部リンク / ドメインのランキング"""
+    ws = wb.create_sheet("外部リンク")
+    ws.append(["【リンク別】"])
     ws.cell(ws.max_row, 1).font = Font(bold=True, size=12)
-    headers = ["トピック"] + [POST_TYPE_LABELS.get(pt, pt) for pt in type_list] + ["合計"]
+    headers = ["No", "URL", "タイトル", "ドメイン", "投稿数", "合計いいね", "代表ユーザー", "代表いいね"]
     ws.append(headers)
     style_header(ws, ws.max_row, len(headers))
-    for tp in topic_list:
-        row = [tp]
-        total = 0
-        for pt in type_list:
-            c = cross[tp][pt]["count"]
-            row.append(c)
-            total += c
-        row.append(total)
-        ws.append(row)
+    for i, e in enumerate(links.top_urls(LINK_SHEET_TOP_K), 1):
+        ws.append([i, e["url"], e["title"] or "—", e["domain"], e["count"], e["likes"],
+                   f"@{e['top_user']}", e["top_likes"]])
+        ws[ws.max_row][5].number_format = NUM_FMT
+        ws[ws.max_row][7].number_format = NUM_FMT
 
-    # いいねマトリクス
     ws.append([])
-    ws.append(["【合計いいね】"])
+    ws.append(["【ドメイン別】"])
     ws.cell(ws.max_row, 1).font = Font(bold=True, size=12)
+    headers = ["No", "ドメイン", "投稿数", "URL数", "合計いいね", "平均いいね"]
     ws.append(headers)
     style_header(ws, ws.max_row, len(headers))
-    for tp in topic_list:
-        row = [tp]
-        total = 0
-        for pt in type_list:
-            lk = cross[tp][pt]["likes"]
-            row.append(lk)
-            total += lk
-        row.append(total)
-        ws.append(row)
-        for cell in ws[ws.max_row][1:]:
-            cell.number_format = NUM_FMT
+    for i, d in enumerate(links.top_domains(LINK_SHEET_TOP_K), 1):
+        ws.append([i, d["domain"], d["count"], d["urls"], d["likes"], d["likes"] / max(d["count"], 1)])
+        ws[ws.max_row][4].number_format = NUM_FMT
+        ws[ws.max_row][5].number_format = NUM_FMT
 
     auto_width(ws)
-    ws.column_dimensions["A"].width = 20
+    ws.column_dimensions["B"].width = 50
+    ws.column_dimensions["C"].width = 40
+
+
+def write_diff_sheet(wb, diff):
+    """前回比較 — 指標・話題・アカウント・伸びた投稿の前回/今回"""
+    ws = wb.create_sheet("前回比較")
+
+    def block(title, headers):
+        if ws.max_row > 1:
+            ws.append([])
+        ws.append([title])
+        ws.cell(ws.max_row, 1).font = Font(bold=True, size=12)
+        ws.append(headers)
+        style_header(ws, ws.max_row, len(headers))
+
+    ws.append([f"前回: {diff.base.name}（{diff.base.total}件） / 今回: {diff.cur.name}（{diff.cur.total}件）"])
+    block("【指標】", ["指標", "前回", "今回", "増減", "増減率"])
+    for label, b, c in diff.metrics:
+        ws.append([label, b, c, c - b, _change(b, c)])
+        fmt = PCT_FMT if label == "平均保存率" else NUM_FMT
+        for cell in ws[ws.max_row][1:4]:
+            cell.number_format = fmt
+        ws[ws.max_row][4].number_format = PCT_FMT
+
+    block("【話題】", ["話題", "前回件数", "今回件数", "前回いいね", "今回いいね", "いいね増減", "増減率"])
+    for topic, bc, cc, bl, cl in diff.topics:
+        ws.append([topic, bc, cc, bl, cl, cl - bl, _change(bl, cl)])
+        for cell in ws[ws.max_row][3:6]:
+            cell.number_format = NUM_FMT
+        ws[ws.max_row][6].number_format = PCT_FMT
+
+    acc = diff.accounts
+    block("【アカウント】", ["区分", "ユーザー名", "前回いいね", "今回いいね", "増減", "今回投稿数", "URL"])
+    rows = ([("新規", None, p) for p in acc["new"]] + [("消えた", p, None) for p in acc["gone"]]
+            + [("継続", b, c) for b, c in acc["rising"]])
+    for kind, b, c in rows:
+        p = c or b
+        bl = b["total_likes"] if b else 0
+        cl = c["total_likes"] if c else 0
+        ws.append([kind, f"@{p['username']}", bl, cl, cl - bl, c["count"] if c else 0, p["account_url"]])
+        for cell in ws[ws.max_row][2:5]:
+            cell.number_format = NUM_FMT
 
+    block("【いいねが伸びた投稿】", ["ユーザー名", "テキスト", "前回いいね", "今回いいね", "増減", "URL"])
+    for b, c in diff.tweets["growth"]:
+        ws.append([f"@{c['username']}", get_display_text(c, 80), _likes(b), _likes(c), _likes(c) - _likes(b),
+                   c.get("tweet_url", "")])
+        for cell in ws[ws.max_row][2:5]:
+            cell.number_format = NUM_FMT
 
-def generate_xlsx(xlsx_path, all_tweets, per_label):
+    auto_width(ws)
+    ws.column_dimensions["A"].width = 20
+    ws.column_dimensions["B"].width = 40
+
+
+@with_rules_snapshot
+def generate_xlsx(xlsx_path, all_tweets, per_label, cross_specs=(), discovered=(), diff=None, data=None):
+    """data: Markdown と共有する ReportData。スレッド・アカウント・リンク・クロス集計は
+    その計算結果を使うので、MD と xlsx で同じ集計を2回しない。
+    data がなければ cross_specs / discovered / diff から xlsx 用に作る"""
+    if data is None:
+        data = ReportData("", all_tweets, per_label, cross_specs=cross_specs)
+        data.discovered = list(discovered)
+        data.diff = diff
     wb = Workbook()
+    cube = data.cube
     write_all_tweets_sheet(wb.active, all_tweets)
     write_insights_sheet(wb, all_tweets, per_label)
-    write_account_sheet(wb, all_tweets)
+    write_account_sheet(wb, all_tweets, data.account_profiles)
     write_buzz_efficiency_sheet(wb, all_tweets)
-    write_cross_tab_sheet(wb, all_tweets)
+    if data.threads:
+        write_thread_sheet(wb, data.threads)
+    write_cross_tab_sheet(wb, all_tweets, cube)
+    for row, col in data.cross_specs:
+        write_cross_slice_sheet(wb, cube, row, col)
+    if data.discovered:
+        write_discover_sheet(wb, data.discovered)
+    if data.diff is not None:
+        write_diff_sheet(wb, data.diff)
     if len(per_label) > 1:
         write_label_sheet(wb, per_label)
     write_type_sheet(wb, all_tweets)
+    if data.links:
+        write_link_sheet(wb, data.links)
     wb.save(str(xlsx_path))
 
 
+# ============================================================
+# 再現可能モード（--reproducible）
+# ============================================================
+#
+# 入力（ファイル内容・ラベル・クエリ・タイトル・トピック・除外ID・スクリプト自体）の
+# ハッシュを出力ディレクトリ名にし、同じハッシュのレポートがあれば再生成しない。
+# 生成日時の代わりにデータ内の最新投稿日時を使い、xlsx の zip/メタデータの時刻も固定する。
+
+# 内容をハッシュする（パスではなく中身が効く）オプション
+REPRO_CONTENT_ARGS = ("files", "titles", "topics", "rules", "baseline")
+# 出力に影響しないオプション
+REPRO_IGNORED_ARGS = ("out_dir", "corpus", "baseline_corpus", "title_store",
+                      "fetch_concurrency", "fetch_per_host", "fetch_timeout")
+REPRO_MANIFEST = "manifest.json"
+REPRO_ZIP_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.digest()
+
+
+def report_input_hash(args, title_store=None, labels=None, baseline_labels=None):
+    """レポート入力のハッシュ（hex）。labels / baseline_labels: 実際に使うラベル
+    （--labels 省略時はファイル名から決まるので、args ではなくこちらを効かせる）"""
+    h = hashlib.sha256()
+    h.update(_file_digest(__file__))  # スクリプトのバージョン
+    opts = {k: v for k, v in vars(args).items()
+            if k not in REPRO_CONTENT_ARGS and k not in REPRO_IGNORED_ARGS}
+    if labels is not None:
+        opts["labels"] = list(labels)
+    if baseline_labels is not None:
+        opts["baseline_labels"] = list(baseline_labels)
+    if opts.get("exclude"):
+        opts["exclude"] = sorted(opts["exclude"])
+    h.update(json.dumps(opts, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+    for key in REPRO_CONTENT_ARGS:
+        paths = getattr(args, key, None) or []
+        for path in [paths] if isinstance(paths, str) else paths:
+            h.update(key.encode("utf-8") + b"\0" + _file_digest(path))
+    # JSON を渡さずコーパスだけから読む場合は、コーパスの中身が入力
+    for files_key, corpus_key in (("files", "corpus"), ("baseline", "baseline_corpus")):
+        path = getattr(args, corpus_key, None)
+        if path and not getattr(args, files_key, None):
+            h.update(corpus_key.encode("utf-8") + b"\0" + _file_digest(path))
+    if title_store is not None:
+        h.update(b"title_store\0" + title_store.digest())
+    return h.hexdigest()
+
+
+def reusable_report(out_dir, input_hash, slug):
+    """同じ入力で作った既存レポートの md パス。manifest がない・ハッシュが違う・
+    manifest にある出力が欠けている場合は None（再生成する）"""
+    try:
+        manifest = json.loads((out_dir / REPRO_MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if manifest.get("input_hash") != input_hash:
+        return None
+    outputs = manifest.get("outputs") or []
+    missing = [name for name in outputs if not (out_dir / name).exists()]
+    if f"{slug}.md" not in outputs or missing:
+        print(f"[再利用] 出力が欠けているため再生成します: {', '.join(missing) or f'{slug}.md'}", file=sys.stderr)
+        return None
+    return out_dir / f"{slug}.md"
+
+
+def data_timestamp(data):
+    """データ内の最新投稿日時（"YYYY-MM-DD HH:MM" UTC）。なければ "—" """
+    latest = data.latest_created_at
+    if not latest:
+        return "—"
+    return latest[:16].replace("T", " ")
+
+
+def make_xlsx_reproducible(xlsx_path, timestamp):
+    """openpyxl が埋め込む作成/更新日時と zip エントリの時刻を固定して書き直す"""
+    stamp = (timestamp.replace(" ", "T") + ":00Z") if timestamp != "—" else "1980-01-01T00:00:00Z"
+    tmp = Path(str(xlsx_path) + ".tmp")
+    with zipfile.ZipFile(xlsx_path) as src, zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            body = src.read(info.filename)
+            if info.filename == "docProps/core.xml":
+                body = re.sub(rb"(<dcterms:(created|modified)[^>]*>)[^<]*(</dcterms:\2>)",
+                              lambda m: m.group(1) + stamp.encode() + m.group(3), body)
+            zi = zipfile.ZipInfo(info.filename, date_time=REPRO_ZIP_TIME)
+            zi.compress_type = zipfile.ZIP_DEFLATED
+            zi.external_attr = 0o644 << 16
+            dst.writestr(zi, body)
+    os.replace(tmp, xlsx_path)
+
+
 # ============================================================
 # main
 # ============================================================
 
+@with_rules_snapshot
 def main():
     parser = argparse.ArgumentParser(description="X Research → Markdown + xlsx バズ分析")
     parser.add_argument("--name", required=True, help="レポートのテーマ名")
-    parser.add_argument("--files", nargs="+", required=True, help="JSONファイルのパス")
+    parser.add_argument("--files", nargs="+", default=[], help="JSONファイルのパス（--corpus が作成済みなら省略可）")
     parser.add_argument("--labels", nargs="+", help="各ファイルのラベル（省略時はファイル名）")
     parser.add_argument("--queries", nargs="+", help="各ファイルの検索クエリ文字列（省略可）")
     parser.add_argument("--titles", help="X記事タイトルのJSONマッピング（{tweet_id: title}）")
@@ -970,10 +3467,54 @@ def main():
     parser.add_argument("--no-xlsx", action="store_true", help="xlsx出力をスキップ")
     parser.add_argument("--exclude", nargs="+", help="除外するツイートID")
     parser.add_argument("--topics", help="TOPIC_RULESのJSONファイル（省略時はデフォルトルール）")
+    parser.add_argument("--rules", help="話題・ノイズ・バズ要因タグのルールファイル（JSON/YAML、更新されると再読み込み）")
+    parser.add_argument("--rule-stats", action="store_true", help="ルール/キーワードごとのヒット数とマッチ時間を stderr に出す")
     parser.add_argument("--no-noise-filter", action="store_true", help="自動ノイズ除去を無効化")
+    parser.add_argument("--sections", nargs="+", choices=list(MD_SECTIONS), help="出力する Markdown セクション（省略時は全セクション）")
+    parser.add_argument("--cross", nargs="+", type=parse_cross_spec, default=[], metavar="ROW:COL",
+                        help=f"追加のクロス集計（{', '.join(CROSS_DIMS)} から 行:列 で指定、例: topic:label）")
+    parser.add_argument("--discover", nargs="?", type=int, const=DISCOVER_DEFAULT_K, default=0, metavar="K",
+                        help=f"話題ルールに当たらない投稿を K 個程度の話題に自動グループ化（default K: {DISCOVER_DEFAULT_K}）")
+    parser.add_argument("--baseline", nargs="+", metavar="FILE", help="比較対象（前回分）の JSON ファイル。前回との差分セクションとシートを追加")
+    parser.add_argument("--baseline-name", default="前回", help="比較対象の表示名（default: 前回）")
+    parser.add_argument("--baseline-corpus",
+                        help="比較対象のバイナリコーパス。--baseline と併用ならそのキャッシュ、単独なら保存済みコーパスと比較")
+    parser.add_argument("--reproducible", action="store_true", help="入力ハッシュで出力先を決め、同じ入力のレポートがあれば再利用（生成日時を埋め込まない）")
+    parser.add_argument("--stream", action="store_true", help="全ツイートを保持せず、ランキングとスケッチだけで集計（大規模コーパス用）")
+    parser.add_argument("--bloom", type=int, metavar="N", help="ID重複除去を Bloom フィルタで行う（N: 想定件数）")
+    parser.add_argument("--account-capacity", type=int, default=1000, help="--stream 時に追跡するアカウント数（Space-Saving）")
+    parser.add_argument("--link-capacity", type=int, default=1000, help="--stream 時に追跡するURL数・ドメイン数（Space-Saving）")
+    parser.add_argument("--title-store", help="X記事タイトルの永続ストア（SQLite）。--titles の内容も蓄積される")
+    parser.add_argument("--fetch-titles", action="store_true",
+                        help="タイトル未取得のX記事・リンクのタイトルを並行取得して --title-store に保存")
+    parser.add_argument("--fetch-concurrency", type=int, default=FETCH_CONCURRENCY, help=f"--fetch-titles の同時リクエスト数（default: {FETCH_CONCURRENCY}）")
+    parser.add_argument("--fetch-per-host", type=int, default=FETCH_PER_HOST, help=f"--fetch-titles の同一ホストへの同時リクエスト数（default: {FETCH_PER_HOST}）")
+    parser.add_argument("--fetch-timeout", type=float, default=FETCH_TIMEOUT, help=f"--fetch-titles の1リクエストあたりのタイムアウト秒。同一ホストの順番待ちは含めない（default: {FETCH_TIMEOUT:g}）")
+    parser.add_argument("--corpus", help="バイナリコーパスのパス（なければ作成、入力が同じなら mmap で再利用。"
+                                         "--files を省略すると保存済みコーパスだけから読む）")
     args = parser.parse_args()
-
-    labels = args.labels if args.labels and len(args.labels) == len(args.files) else [Path(f).stem for f in args.files]
+    if args.fetch_titles and not args.title_store:
+        parser.error("--fetch-titles には取得結果の保存先として --title-store が必要です")
+    if args.rules and args.topics:
+        parser.error("--topics と --rules は併用できません（--rules の topics に書いてください）")
+    if not args.files and not args.corpus:
+        parser.error("--files か、作成済みの --corpus のどちらかが必要です")
+    if args.stream and (args.baseline or args.baseline_corpus):
+        parser.error("--baseline は --stream と併用できません（ツイートIDでの突き合わせに全件が必要）")
+    if args.stream and args.discover:
+        parser.error("--discover は --stream と併用できません（全投稿の本文が必要なため）")
+    if args.stream and args.cross:
+        parser.error("--cross は --stream と併用できません（クロス集計は全件のカテゴリコードが必要）")
+
+    # --files / --baseline を省略したときは、コーパスのヘッダにある元ファイル名からラベルを作る
+    try:
+        source_files = args.files or corpus_source_files(args.corpus)
+        baseline_files = args.baseline or (corpus_source_files(args.baseline_corpus) if args.baseline_corpus else [])
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(f"コーパスを開けません: {e}")
+    labels = (args.labels if args.labels and len(args.labels) == len(source_files)
+              else [Path(f).stem for f in source_files])
+    baseline_labels = [Path(f).stem for f in baseline_files]
     exclude_ids = set(args.exclude or [])
 
     # TOPIC_RULES差し替え
@@ -982,32 +3523,128 @@ def main():
         custom = json.loads(Path(args.topics).read_text())
         TOPIC_RULES = [(r["name"], r["keywords"]) for r in custom]
         print(f"[カスタムTOPIC_RULES] {len(TOPIC_RULES)}カテゴリ読み込み", file=sys.stderr)
+    if args.rules:
+        try:
+            rules = RuleSet.from_file(args.rules)
+        except RULE_LOAD_ERRORS as e:
+            parser.error(f"--rules の読み込みに失敗: {e}")
+        print(f"[ルール] {args.rules}: 話題{len(rules.topics)} / ノイズ{len(rules.noise)} / "
+              f"バズ要因{len(rules.buzz_text) + len(rules.buzz_title)}", file=sys.stderr)
+    else:
+        rules = RuleSet()
+    rules.profile = args.rule_stats
+    set_rules(rules)
 
     # タイトルマッピング読み込み
     title_map = None
     if args.titles:
         title_map = json.loads(Path(args.titles).read_text())
 
-    all_tweets, per_label = load_and_dedupe(
-        args.files, labels, title_map, exclude_ids,
-        auto_noise=not args.no_noise_filter,
-    )
-    md = generate_md(args.name, all_tweets, per_label, labels, queries=args.queries)
+    title_store = None
+    if args.title_store:
+        title_store = TitleStore(args.title_store)
+        if title_map:
+            added = title_store.update(title_map)
+            print(f"[タイトルストア] {added}件を登録（計{len(title_store)}件）", file=sys.stderr)
 
     slug = args.name.replace(" ", "-").replace("/", "-").lower()
-    out_dir = Path(args.out_dir) / datetime.now().strftime("%Y-%m-%d") / slug
+    input_hash = None
+    if args.reproducible:
+        # 同じ入力のレポートが既にあれば、読み込みも生成もせずに返す
+        input_hash = report_input_hash(args, title_store, labels, baseline_labels)
+        out_dir = Path(args.out_dir) / slug / input_hash[:16]
+        md_path = reusable_report(out_dir, input_hash, slug)
+        if md_path is not None:
+            sys.stdout.write(md_path.read_text(encoding="utf-8"))
+            print()
+            print(f"[再利用] 入力が同じレポートがあるため再生成しません: {out_dir}", file=sys.stderr)
+            if title_store is not None:
+                title_store.close()
+            return
+    else:
+        out_dir = Path(args.out_dir) / datetime.now().strftime("%Y-%m-%d") / slug
+
+    seen = BloomFilter(args.bloom) if args.bloom else None
+    fetcher = None
+    if title_store is not None:
+        # --fetch-titles なしでも、以前に取得したタイトルは当てる
+        fetcher = TitleFetcher(title_store, args.fetch_concurrency, args.fetch_per_host, args.fetch_timeout,
+                               offline=not args.fetch_titles)
+    if args.stream:
+        # 1件ずつ集計し、ツイート本体はヒープに残るぶんしか保持しない
+        data = StreamReportData(args.name, labels, queries=args.queries, account_capacity=args.account_capacity,
+                                link_capacity=args.link_capacity)
+        noise_count = 0
+        def on_noise(t, lang):
+            nonlocal noise_count
+            noise_count += 1
+            print(format_noise(t, lang), file=sys.stderr)
+        for _, t in iter_loaded_tweets(
+            args.files, labels, title_map, exclude_ids,
+            auto_noise=not args.no_noise_filter, corpus_path=args.corpus,
+            title_store=title_store, seen=seen, on_noise=on_noise, fetcher=fetcher,
+        ):
+            data.add(t)
+        if noise_count:
+            print(f"[自動ノイズ除去] {noise_count}件を除外", file=sys.stderr)
+    else:
+        all_tweets, per_label = load_and_dedupe(
+            args.files, labels, title_map, exclude_ids,
+            auto_noise=not args.no_noise_filter, corpus_path=args.corpus,
+            title_store=title_store, seen=seen, fetcher=fetcher,
+        )
+        baseline = None
+        if baseline_files:
+            # 前回分は ID 重複除去を別にして読む（同じ投稿が両方にあるのが突き合わせの前提）
+            base_tweets, base_per_label = load_and_dedupe(
+                args.baseline, baseline_labels, title_map, exclude_ids,
+                auto_noise=not args.no_noise_filter, corpus_path=args.baseline_corpus,
+                title_store=title_store, fetcher=fetcher,
+            )
+            baseline = ReportData(args.baseline_name, base_tweets, base_per_label)
+            print(f"[比較] {args.baseline_name}: {baseline.total}件", file=sys.stderr)
+        data = ReportData(args.name, all_tweets, per_label, labels, queries=args.queries, cross_specs=args.cross,
+                          discover_k=args.discover, baseline=baseline)
+    if fetcher is not None:
+        fetcher.close()
+        if args.fetch_titles:
+            print(f"[タイトル取得] {fetcher.fetched}件を取得（タイトルあり {fetcher.found}件）", file=sys.stderr)
+    if title_store is not None:
+        title_store.close()
+
     out_dir.mkdir(parents=True, exist_ok=True)
+    if args.reproducible:
+        stamp = data_timestamp(data)
+        data.now = f"{stamp}（最新投稿）"
 
+    # セクションが出来た順にファイルと stdout へ書き出す
     md_path = out_dir / f"{slug}.md"
-    md_path.write_text(md, encoding="utf-8")
+    outputs = [md_path.name]
+    with open(md_path, "w", encoding="utf-8") as f:
+        write_md(data, out=f, echo=sys.stdout, sections=args.sections)
+    print()
     print(f"Saved: {md_path}", file=sys.stderr)
 
-    if not args.no_xlsx and all_tweets:
+    if not args.no_xlsx and data.total:
         xlsx_path = out_dir / f"{slug}.xlsx"
-        generate_xlsx(xlsx_path, all_tweets, per_label)
+        if args.stream:
+            generate_stream_xlsx(xlsx_path, data)
+        else:
+            generate_xlsx(xlsx_path, all_tweets, per_label, data=data)
+        if args.reproducible:
+            make_xlsx_reproducible(xlsx_path, stamp)
+        outputs.append(xlsx_path.name)
         print(f"Saved: {xlsx_path}", file=sys.stderr)
 
-    print(md)
+    if args.reproducible:
+        # 最後に書くことで、途中で落ちたレポートは再利用されない
+        manifest = {"input_hash": input_hash, "name": args.name, "total": data.total,
+                    "files": [Path(f).name for f in source_files], "outputs": outputs}
+        (out_dir / REPRO_MANIFEST).write_text(
+            json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+    if args.rule_stats:
+        print(get_rules().stats_report(), file=sys.stderr)
 
 
 if __name__ == "__main__":